@@ -1,12 +1,17 @@
 from constraints import *
-from backtracking import bt_search, GacEnforce
+from backtracking import bt_search, GacEnforce, countSolutions
 from csp import Variable, CSP
 from csp_problems import nQueens, sudokuCSP, solve_planes
+from csp_problems import nQueensAllDiff, nQueensCount, nQueensSolutions, SudokuTemplate
+from csp_problems import planes_csp, solve_planes_components, count_planes
+from exact_cover import cspExactCover, sudokuCount
+from sudoku_engine import bitCount
 from sudoku import b1, b5, b6
 from plane_scheduling import p1, p2, p3, p4, p5, p6, p7, check_plane_solution
 import argparse
+import random
 
-legalQs = ["q1", "q2", "q3", "q4", "q5", "q6"]
+legalQs = ["q1", "q2", "q3", "q4", "q5", "q6", "q7"]
 tested = [False]*5
 
 gradeMessage = ""
@@ -18,7 +23,8 @@ titles = ["Q1. Table Constraint for nQueens (4 points)",
           "Q3. GacEnforce and GAC implementation (5 points)",
           "Q4. AllDiff for Sudoku (2 points)",
           "Q5. NValues Constraint implementation (4 points)",
-          "Q6. Plane Scheduling (10 points)"]
+          "Q6. Plane Scheduling (10 points)",
+          "Q7. Solution counts of the other engines and models (not marked)"]
 
 def print_title(i):
     l = max([len(t) for t in titles])
@@ -719,6 +725,97 @@ def question_6():
         if not fails[7]:
             grades[5] += 4
 
+def mddQueens(n):
+    '''nQueens(n, True) with MDDTableConstraints'''
+    vars = [Variable('Q{}'.format(i), range(1, n+1)) for i in range(1, n+1)]
+    cons = []
+    for i in range(n):
+        for j in range(i+1, n):
+            sat = [(a, b) for a in range(1, n+1) for b in range(1, n+1)
+                   if a != b and abs(a - b) != j - i]
+            cons.append(MDDTableConstraint("C(Q{},Q{})".format(i+1, j+1),
+                                           [vars[i], vars[j]], sat))
+    return CSP("{}-Queens".format(n), vars, cons)
+
+def question_7():
+    print_title(6)
+    fails = []
+    random.seed(0)  #for MC
+
+    #Each test counts the solutions of one problem with GAC search on
+    #the original model, and then with every other engine, model and
+    #propagator that solves it (BT only uses the constraints' checks,
+    #so it also tests their propagators). Each code below is evaluated
+    #with {} replaced by the problem and must give the same count.
+    def do_test(n, ref, codes, arg):
+        expected = eval(ref.format(arg))
+        failed = False
+        for code in codes:
+            code = code.format(arg)
+            got = eval(code)
+            if code.startswith("len(bt_search('MC'"):
+                ok = got == min(expected, 1)   #one solution
+            else:
+                ok = got == expected
+            if not ok:
+                failed = True
+                print "Error: expected {} solution(s) got {}".format(expected, got)
+                print "Errors were generated on the following code:"
+                print "    " + code
+        if failed:
+            fails.append(n)
+            print "\nFail Q7 test {}".format(n)
+        else:
+            print "Pass Q7 test {}".format(n)
+        print_sep()
+
+    test = 0
+    for n in range(4, 9):
+        test += 1
+        codes = ["len(bt_search('BT', nQueens({}, False), 'fixed', True, False)[0])",
+                 "len(bt_search('GAC', nQueens({}, True), 'mrv', True, False)[0])",
+                 "len(bt_search('GAC', mddQueens({}), 'mrv', True, False)[0])",
+                 "len(bt_search('FC', nQueens({}, False, 'fc'), 'mrv', True, False)[0])",
+                 "len(bt_search('GAC', nQueens({}, False, 'gac'), 'mrv', True, False)[0])",
+                 "len(bt_search('GAC', nQueensAllDiff({}, 'gac'), 'mrv', True, False)[0])",
+                 "len(bt_search('GAC', nQueensAllDiff({}, 'bounds'), 'mrv', True, False)[0])",
+                 "len(bt_search('MC', nQueens({}, False), 'mrv', False, False)[0])",
+                 "nQueensCount({})",
+                 "len(list(nQueensSolutions({})))",
+                 "countSolutions(nQueens({}, False))",
+                 "cspExactCover(nQueensAllDiff({})).count()"]
+        if n <= 6:
+            #FC only prunes an alldiff with one variable left
+            codes.extend(["len(bt_search('FC', nQueensAllDiff({}, 'gac'), 'mrv', True, False)[0])",
+                          "len(bt_search('FC', nQueensAllDiff({}, 'bounds'), 'mrv', True, False)[0])"])
+        if n <= 7:
+            #every pair of rows is linked, so TD is exponential in n
+            codes.append("len(bt_search('TD', nQueens({}, False), 'mrv', True, False)[0])")
+        do_test(test, "len(bt_search('GAC', nQueens({}, False), 'fixed', True, False)[0])",
+                codes, n)
+
+    for p in ["p1", "p2", "p3", "p4", "p5", "p6", "p7"]:
+        test += 1
+        codes = ["len(solve_planes({}, 'BT', True, 'mrv', True))",
+                 "len(solve_planes({}, 'GAC', True, 'mrv', True, model='regular'))",
+                 "len(solve_planes({}, 'GAC', True, 'mrv', True, model='successor'))",
+                 "solve_planes_components({}, 'GAC', True, 'mrv', True).count()",
+                 "bt_search('GAC', planes_csp({}), 'mrv', True, False, decompose=True)[0].count()",
+                 "count_planes({}, 'pairwise', silent=True)",
+                 "count_planes({}, 'regular', silent=True)",
+                 "count_planes({}, 'successor', silent=True)",
+                 "len(bt_search('TD', planes_csp({}), 'mrv', True, False)[0])",
+                 "cspExactCover(planes_csp({})).count()"]
+        do_test(test, "len(solve_planes({}, 'GAC', True, 'mrv', True))", codes, p)
+
+    for b in ["b1", "b5", "b6"]:
+        test += 1
+        codes = ["len(bt_search('GAC', sudokuCSP({}, 'alldiff'), 'mrv', True, False)[0])",
+                 "len(bt_search('GAC', SudokuTemplate(3, 'alldiff').load({}), 'mrv', True, False)[0])",
+                 "bitCount({})",
+                 "sudokuCount({})"]
+        do_test(test, "len(bt_search('GAC', sudokuCSP({}, 'neq'), 'mrv', True, False)[0])", codes, b)
+
 def outputGrades():
     print_sep('=')
     for i in range(len(grades)):
@@ -750,6 +847,8 @@ if __name__ == '__main__':
             question_5()
         if args.question == legalQs[5]:
             question_6()
+        if args.question == legalQs[6]:
+            question_7()
 
 
     else:
@@ -759,6 +858,7 @@ if __name__ == '__main__':
         question_4()
         question_5()
         question_6()
+        question_7()
 
 
     outputGrades()
@@ -1,5 +1,11 @@
 from csp import Constraint, Variable, CSP
+from constraints import PropagatorConstraint, PruningConstraint
+from tree_decomposition import TreeDecomposition
+import collections
+import itertools
+import multiprocessing
 import random
+import sys
 import util
 
 class UnassignedVars:
@@ -20,6 +26,7 @@ class UnassignedVars:
             print "Error UnassignedVars given an illegal selection criteria {}. Must be one of 'random', 'stack', 'queue', or 'mrv'".format(select_criteria)
         self.unassigned = list(csp.variables())
         self.csp = csp
+        self._vars = set(self.unassigned)
         self._select = select_criteria
         if select_criteria == 'fixed':
             #reverse unassigned list so that we can add and extract from the back
@@ -46,28 +53,53 @@ class UnassignedVars:
         return len(self.unassigned) == 0
 
     def insert(self, var):
-        if not var in self.csp.variables():
+        if not var in self._vars:
             print "Error, trying to insert variable {} in unassigned that is not in the CSP problem".format(var.name())
         else:
             self.unassigned.append(var)
 
-def bt_search(algo, csp, variableHeuristic, allSolutions, trace):
+def bt_search(algo, csp, variableHeuristic, allSolutions, trace, nodeLimit=None,
+              decompose=False, processes=1, cache=None):
     '''Main interface routine for calling different forms of backtracking search
-       algorithm is one of ['BT', 'FC', 'GAC']
+       algorithm is one of ['BT', 'FC', 'GAC', 'MC', 'TD'] ('MC' is
+       min-conflicts local search, see MinConflicts, 'TD' is dynamic
+       programming over a tree decomposition, see TreeDecomposition)
        csp is a CSP object specifying the csp problem to solve
        variableHeuristic is one of ['random', 'fixed', 'mrv']
        allSolutions True or False. True means we want to find all solutions.
        trace True of False. True means turn on tracing of the algorithm
+       nodeLimit if given, BT, FC and GAC give up (returning the solutions
+       found so far) after exploring that many nodes ('TD' ignores
+       variableHeuristic, trace and nodeLimit, and its nodes are the
+       partial assignments of its bags)
 
        bt_search returns a list of solutions. Each solution is itself a list
        of pairs (var, value). Where var is a Variable object, and value is
        a value from its domain.
+
+       decompose True splits csp into the connected components of its
+       constraint graph (see cspComponents) and searches each one on
+       its own, using processes worker processes if processes > 1.
+       The solutions are then returned as a SolutionProduct of the
+       components' solutions (a lazy list whose count() is the number
+       of solutions, without generating them), and nodeLimit applies
+       to each component. cache, a dictionary kept by the caller,
+       stores the solutions of each component searched under a
+       signature of its constraints (their signature() and the
+       positions of their scopes among the component's variables) and
+       the domains of its variables, so a component equal to one
+       searched before, in this call or a later one, even of another
+       CSP, isn't searched again. (Constraints without a signature of
+       their own are only equal to themselves, don't reuse a cache
+       after changing one of those in place, e.g., with
+       MDDTableConstraint.setTable.)
     '''
     varHeuristics = ['random', 'fixed', 'mrv']
-    algorithms = ['BT', 'FC', 'GAC']
+    algorithms = ['BT', 'FC', 'GAC', 'MC', 'TD']
 
     #statistics
     bt_search.nodesExplored = 0
+    bt_search.nodeLimit = nodeLimit
 
     if variableHeuristic not in varHeuristics:
         print "Error. Unknown variable heursitics {}. Must be one of {}.".format(
@@ -76,6 +108,12 @@ def bt_search(algo, csp, variableHeuristic, allSolutions, trace):
         print "Error. Unknown algorithm heursitics {}. Must be one of {}.".format(
             algo, algorithms)
 
+    if decompose:
+        return _componentSearch(algo, csp, variableHeuristic, allSolutions, trace,
+                                nodeLimit, processes, cache)
+
+    #the search recurses once per variable
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 2*len(csp.variables()) + 1000))
     uv = UnassignedVars(variableHeuristic,csp)
     Variable.clearUndoDict()
     for v in csp.variables():
@@ -90,9 +128,254 @@ def bt_search(algo, csp, variableHeuristic, allSolutions, trace):
     elif algo == 'GAC':
         GacEnforce(csp.constraints(), csp, None, None) #GAC at the root
         solutions = GAC(uv, csp, allSolutions, trace)
+    elif algo == 'MC':
+        #search the domains left by GAC at the root
+        if GacEnforce(csp.constraints(), csp, None, None) == "DWO":
+            solutions = []
+        else:
+            solutions = MinConflicts(csp, trace=trace)
+    elif algo == 'TD':
+        #decompose over the domains left by GAC at the root
+        if GacEnforce(csp.constraints(), csp, None, None) == "DWO":
+            solutions = []
+        else:
+            td = TreeDecomposition(csp)
+            solutions = list(itertools.islice(td.solutions(),
+                                              None if allSolutions else 1))
+            bt_search.nodesExplored = td.nodes
 
     return solutions, bt_search.nodesExplored
 
+def cspComponents(csp):
+    '''Return the connected components of the constraint graph of csp
+       (two variables are linked if a constraint has both in its
+       scope) as a list of (variables, constraints) pairs, the
+       variables in the order of csp.variables()'''
+    component = dict()      #var --> component number
+    order = dict()
+    parts = []
+    for i, v in enumerate(csp.variables()):
+        order[v] = i
+        if v in component:
+            continue
+        k = len(parts)
+        component[v] = k
+        members = []
+        stack = [v]
+        while stack:
+            x = stack.pop()
+            members.append(x)
+            for c in csp.constraintsOf(x):
+                for y in c.scope():
+                    if y not in component:
+                        component[y] = k
+                        stack.append(y)
+        parts.append((members, []))
+    for c in csp.constraints():
+        if c.scope():
+            parts[component[c.scope()[0]]][1].append(c)
+    for (members, cnstrs) in parts:
+        members.sort(key=lambda v: order[v])
+    return parts
+
+#the components searched by the worker processes of _componentSearch
+_searchParts = []
+
+def _componentSearch(algo, csp, variableHeuristic, allSolutions, trace,
+                     nodeLimit, processes, cache):
+    '''bt_search with decompose=True'''
+    parts = cspComponents(csp)
+    results = [None] * len(parts)
+    keys = [None] * len(parts)
+    todo = []
+    same = []           #(k, j): part k is equal to part j, searched instead
+    first = dict()      #key --> the first part with that key
+    for k, (vars, cnstrs) in enumerate(parts):
+        if not cnstrs:
+            #unconstrained variable, every value is a solution
+            values = vars[0].domain()
+            results[k] = [[(vars[0], val)] for val in (values if allSolutions else values[:1])]
+            continue
+        if cache is not None:
+            keys[k] = _componentKey(algo, allSolutions, vars, cnstrs)
+            if keys[k] in cache:
+                results[k] = [zip(vars, vals) for vals in cache[keys[k]]]
+                continue
+            if keys[k] in first:
+                same.append((k, first[keys[k]]))
+                continue
+            first[keys[k]] = k
+        todo.append(k)
+
+    nodes = 0
+    if processes > 1 and len(todo) > 1:
+        #the workers get the parts by forking, and return values
+        #rather than (copies of) the variables
+        del _searchParts[:]
+        _searchParts.extend(parts)
+        pool = multiprocessing.Pool(min(processes, len(todo)))
+        try:
+            answers = pool.map(_componentTask, [(k, algo, variableHeuristic, allSolutions, nodeLimit)
+                                                for k in todo], 1)
+        finally:
+            pool.close()
+            pool.join()
+            del _searchParts[:]
+        for k, (values, explored) in zip(todo, answers):
+            vars = parts[k][0]
+            results[k] = [zip(vars, vals) for vals in values]
+            nodes += explored
+    else:
+        for k in todo:
+            vars, cnstrs = parts[k]
+            solutions, explored = bt_search(algo, CSP("{} part {}".format(csp.name(), k+1), vars, cnstrs),
+                                            variableHeuristic, allSolutions, trace, nodeLimit)
+            results[k] = []
+            for s in solutions:
+                values = dict(s)
+                results[k].append([(v, values[v]) for v in vars])
+            nodes += explored
+            if not solutions:
+                break       #no solutions at all, skip the other parts
+    for k in todo:
+        if results[k] is None:
+            results[k] = []     #not searched
+        elif keys[k] is not None and nodeLimit is None:
+            cache[keys[k]] = [tuple([val for (var, val) in s]) for s in results[k]]
+    for (k, j) in same:
+        results[k] = [zip(parts[k][0], [val for (var, val) in s]) for s in results[j]]
+    bt_search.nodesExplored = nodes
+    return SolutionProduct(results), nodes
+
+def _componentKey(algo, allSolutions, vars, cnstrs):
+    #the cache key of a component: equal for components whose
+    #variables (in order) have the same domains and constraints
+    position = dict([(v, i) for i, v in enumerate(vars)])
+    return (algo, allSolutions,
+            frozenset([(c.signature(), tuple([position[v] for v in c.scope()])) for c in cnstrs]),
+            tuple([tuple(v.domain()) for v in vars]))
+
+def _componentTask(task):
+    k, algo, variableHeuristic, allSolutions, nodeLimit = task
+    vars, cnstrs = _searchParts[k]
+    solutions, explored = bt_search(algo, CSP("part {}".format(k+1), vars, cnstrs),
+                                    variableHeuristic, allSolutions, False, nodeLimit)
+    answers = []
+    for s in solutions:
+        values = dict(s)
+        answers.append(tuple([values[v] for v in vars]))
+    return answers, explored
+
+def countSolutions(csp, cacheSize=100000, stats=None):
+    '''Return the number of solutions of csp, without generating them.
+
+       The search assigns a variable (MRV), enforces GAC, and splits
+       the variables still unassigned into the connected components
+       of the constraints linking them. The components share no
+       unassigned variable, so the number of solutions under the
+       assignment is the product of their counts, each counted by a
+       search of its own. A component's count only depends on its
+       variables and their current domains, its constraints and the
+       values of the assigned variables in their scopes, so it is
+       cached under that signature and a component that recurs (with
+       other values of the variables it is independent of) isn't
+       searched again. The cache keeps at most cacheSize counts,
+       evicting the least recently used one.
+
+       If given, the dictionary stats gets the number of 'nodes'
+       searched, cache 'hits' and 'evictions'.'''
+    index = dict([(v, i) for i, v in enumerate(csp.variables())])
+    cindex = dict([(c, i) for i, c in enumerate(csp.constraints())])
+    cache = collections.OrderedDict()   #signature --> count, oldest use first
+    counts = {'nodes' : 0, 'hits' : 0, 'evictions' : 0}
+
+    def components(vars):
+        seen = set()
+        parts = []
+        for v in vars:
+            if v in seen:
+                continue
+            seen.add(v)
+            members = []
+            stack = [v]
+            while stack:
+                x = stack.pop()
+                members.append(x)
+                for c in csp.constraintsOf(x):
+                    for y in c.scope():
+                        if y not in seen and not y.isAssigned():
+                            seen.add(y)
+                            stack.append(y)
+            parts.append(members)
+        return parts
+
+    def signature(vars):
+        cnstrs = set()
+        for v in vars:
+            cnstrs.update(csp.constraintsOf(v))
+        fixed = set()
+        for c in cnstrs:
+            for y in c.scope():
+                if y.isAssigned():
+                    fixed.add(y)
+        return (tuple(sorted([cindex[c] for c in cnstrs])),
+                tuple(sorted([(index[v], tuple(sorted(v.curDomain()))) for v in vars])),
+                tuple(sorted([(index[y], y.getValue()) for y in fixed])))
+
+    def count(vars):
+        key = signature(vars)
+        if key in cache:
+            counts['hits'] += 1
+            n = cache.pop(key)
+            cache[key] = n      #now the most recently used
+            return n
+        counts['nodes'] += 1
+        var = min(vars, key=lambda v: v.curDomainSize())
+        rest = [v for v in vars if v is not var]
+        total = 0
+        for val in var.curDomain():
+            var.setValue(val)
+            consistent = True
+            for c in csp.constraintsOf(var):
+                if c.numUnassigned() == 0 and not c.check():
+                    consistent = False
+                    break
+            if consistent and GacEnforce(csp.constraintsOf(var), csp, var, val) != "DWO":
+                n = 1
+                for part in components(rest):
+                    n *= count(part)
+                    if not n:
+                        break
+                total += n
+            Variable.restoreValues(var, val)
+        var.unAssign()
+        cache[key] = total
+        if len(cache) > cacheSize:
+            cache.popitem(last=False)
+            counts['evictions'] += 1
+        return total
+
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 2*len(csp.variables()) + 1000))
+    Variable.clearUndoDict()
+    for v in csp.variables():
+        v.reset()
+    total = 0
+    if GacEnforce(csp.constraints(), csp, None, None) != "DWO":
+        total = 1
+        for part in components(csp.variables()):
+            total *= count(part)
+            if not total:
+                break
+    for v in csp.variables():
+        v.reset()
+    if stats is not None:
+        stats.update(counts)
+    return total
+
+def _outOfNodes():
+    limit = getattr(bt_search, 'nodeLimit', None)
+    return limit is not None and bt_search.nodesExplored >= limit
+
 def BT(unAssignedVars, csp, allSolutions, trace):
     '''Backtracking Search. unAssignedVars is the current set of
        unassigned variables.  csp is the csp problem, allSolutions is
@@ -114,11 +397,15 @@ def BT(unAssignedVars, csp, allSolutions, trace):
         for v in csp.variables():
             soln.append((v, v.getValue()))
         return [soln]  #each call returns a list of solutions found
+    if _outOfNodes():
+        return []
     bt_search.nodesExplored += 1
     solns = []         #so far we have no solutions recursive calls
     nxtvar = unAssignedVars.extract()
     if trace: print "==>Trying {}".format(nxtvar.name())
     for val in nxtvar.domain():
+        if _outOfNodes():
+            break
         if trace: print "==> {} = {}".format(nxtvar.name(), val)
         nxtvar.setValue(val)
         constraintsOK = True
@@ -143,11 +430,17 @@ def FCCheck(cnstr, reasonVar, reasonVal):
     if cnstr.numUnassigned() != 1:
         print "Error FCCheck called on constraint {} with {} neq 1 unassigned vars".format(cnstr.name(), cnstr.numUnassignedVars)
     var = cnstr.unAssignedVars()[0]
-    for val in var.curDomain():
-        var.setValue(val)
-        if not cnstr.check():
+    if isinstance(cnstr, PropagatorConstraint) and cnstr.exactSupports:
+        #with one unassigned variable the supported values are exactly
+        #the values that don't falsify the constraint
+        for val in cnstr.unsupportedValues()[cnstr.scope().index(var)]:
             var.pruneValue(val, reasonVar, reasonVal)
-        var.unAssign()  #NOTE WE MUST UNDO TRIAL ASSIGNMENT
+    else:
+        for val in var.curDomain():
+            var.setValue(val)
+            if not cnstr.check():
+                var.pruneValue(val, reasonVar, reasonVal)
+            var.unAssign()  #NOTE WE MUST UNDO TRIAL ASSIGNMENT
     if var.curDomainSize() == 0:
         return "DWO"
     return "OK"
@@ -181,15 +474,23 @@ def FC(unAssignedVars, csp, allSolutions, trace):
             soln.append((var, var.getValue()))
         return [soln] #Return [[var1,val1),(var2,val2)...]]
     
+    if _outOfNodes():
+        return []
     all_sol = []
     var = unAssignedVars.extract()
     bt_search.nodesExplored += 1 #Increase the number of the explored nodes 
     
     for val in var.curDomain():
+        if _outOfNodes():
+            break
         var.setValue(val)
         noDWO = True
         for cons in csp.constraintsOf(var):
-            if cons.numUnassigned() == 1:
+            if isinstance(cons, PruningConstraint):
+                if cons.prune(var, val) == 'DWO':
+                    noDWO = False
+                    break
+            elif cons.numUnassigned() == 1:
                 if FCCheck(cons, var, val) == 'DWO':
                     noDWO = False
                     break
@@ -221,21 +522,53 @@ def GacEnforce(constraints, csp, reasonVar, reasonVal):
 
     #cnstrs is a queue of constraints not known GAC 
     cnstrs = util.Queue()
+    queued = set()    #the constraints in cnstrs, for fast membership tests
     for cons in constraints:
         cnstrs.push(cons)
+        queued.add(cons)
     while not cnstrs.isEmpty():
         cnstr = cnstrs.pop()
-        for var in cnstr.scope():
-            for val in var.curDomain():
-                #Prune the variable of var if it does not have a support
-                if not cnstr.hasSupport(var, val):
-                    var.pruneValue(val, reasonVar, reasonVal)
-                    if var.curDomainSize() == 0:
-                        return "DWO"
-                    #Push all the constraints related to the pruned var back into the queue
-                    for recheck in csp.constraintsOf(var):
-                        if recheck != cnstr and not recheck in cnstrs.list:
-                            cnstrs.push(recheck)
+        queued.discard(cnstr)
+        if isinstance(cnstr, PruningConstraint):
+            #the constraint prunes the domains itself
+            changed = cnstr.prune(reasonVar, reasonVal)
+            if changed == "DWO":
+                return "DWO"
+            for var in changed:
+                size = var.curDomainSize()
+                if size > csp.recheckSize(var):
+                    continue
+                for recheck in csp.constraintsOf(var):
+                    if size <= recheck.recheckSize and recheck != cnstr and not recheck in queued:
+                        cnstrs.push(recheck)
+                        queued.add(recheck)
+            continue
+        if isinstance(cnstr, PropagatorConstraint):
+            #one filtering pass gives the unsupported values of every variable
+            unsupported = cnstr.unsupportedValues()
+        for i, var in enumerate(cnstr.scope()):
+            if isinstance(cnstr, PropagatorConstraint):
+                prune = unsupported[i]
+            else:
+                prune = [val for val in var.curDomain() if not cnstr.hasSupport(var, val)]
+            #Prune the values of var that do not have a support
+            for val in prune:
+                if var.isAssigned():
+                    return "DWO"    #the assignment itself has no support
+                var.pruneValue(val, reasonVar, reasonVal)
+                if var.curDomainSize() == 0:
+                    return "DWO"
+            if prune:
+                #Push all the constraints related to the pruned var back
+                #into the queue, unless var still has too many values
+                #left for them to lose supports (see Constraint.recheckSize)
+                size = var.curDomainSize()
+                if size > csp.recheckSize(var):
+                    continue
+                for recheck in csp.constraintsOf(var):
+                    if size <= recheck.recheckSize and recheck != cnstr and not recheck in queued:
+                        cnstrs.push(recheck)
+                        queued.add(recheck)
     return "OK"
     
 
@@ -268,11 +601,15 @@ def GAC(unAssignedVars, csp, allSolutions, trace):
             soln.append((var, var.getValue()))
         return [soln] #Return [[var1,val1),(var2,val2)...]]
     
+    if _outOfNodes():
+        return []
     all_sol = []
     var = unAssignedVars.extract()
     bt_search.nodesExplored += 1 #Increase the number of the explored nodes 
     
     for val in var.curDomain():
+        if _outOfNodes():
+            break
         var.setValue(val)
         noDWO = True
         if GacEnforce(csp.constraintsOf(var), csp, var, val) == "DWO":
@@ -290,4 +627,249 @@ def GAC(unAssignedVars, csp, allSolutions, trace):
     unAssignedVars.insert(var) #Restore var to unAssignedVars
     return all_sol
 
+def compileTemplate(csp, variables=None, constraints=None):
+    '''Make csp a template whose parameters are the domains of
+       variables and the satisfying assignments of constraints (see
+       CSP.setParameters and CSP.bind).
+
+       GAC is enforced once here on the constraints that have no
+       parameter in their scope and are not parameters themselves.
+       Their pruning is the same for every instance, so it becomes
+       part of the (original) domains of the other variables and is
+       not redone for each instance. Returns False if these
+       constraints alone have no solution (no instance has one).'''
+    if variables is None:
+        variables = []
+    if constraints is None:
+        constraints = []
+    csp.setParameters(variables, constraints)
+    params = set(variables)
+    fixed = [c for c in csp.constraints()
+             if c not in constraints and not params.intersection(c.scope())]
+    for v in csp.variables():
+        v.reset()
+    if not fixed:
+        return True
+    #propagate over a CSP of just these constraints, so no parameter
+    #constraint is revisited when a domain changes
+    inFixed = set()
+    for c in fixed:
+        inFixed.update(c.scope())
+    part = CSP(csp.name(), [v for v in csp.variables() if v in inFixed], fixed)
+    #so restoring the (None, None) prunes only undoes this propagation
+    Variable.clearUndoDict()
+    if GacEnforce(fixed, part, None, None) == "DWO":
+        Variable.restoreValues(None, None)
+        return False
+    pruned = [(v, v.curDomain()) for v in part.variables()
+              if v.curDomainSize() < v.domainSize()]
+    Variable.restoreValues(None, None)
+    for (v, dom) in pruned:
+        v.resetDomain(dom)
+        v.reset()
+    return True
+
     
+class ConflictTable:
+    '''The conflicts of a complete assignment for local search. A
+       variable is in conflict with a constraint if
+       cnstr.violations(var, value of var) > 0. The table keeps, for
+       each variable, the number of constraints it is in conflict
+       with, and the list of the variables in movable (those that
+       can change value) that are in some conflict. After changing
+       the value of a variable, update(var) re-evaluates only the
+       constraints of that variable.'''
+
+    def __init__(self, csp, movable):
+        self.csp = csp
+        self._movable = movable
+        self._bad = set()          #(cnstr, var) pairs in conflict
+        self._count = dict()
+        self._conflicted = []
+        self._index = dict()       #var --> position in _conflicted
+        for v in csp.variables():
+            self._count[v] = 0
+        for c in csp.constraints():
+            self._evaluate(c)
+
+    def _evaluate(self, cnstr):
+        for v in cnstr.scope():
+            key = (cnstr, v)
+            bad = cnstr.violations(v, v.getValue()) > 0
+            if bad == (key in self._bad):
+                continue
+            if bad:
+                self._bad.add(key)
+                self._count[v] += 1
+                if self._count[v] == 1 and v in self._movable:
+                    self._index[v] = len(self._conflicted)
+                    self._conflicted.append(v)
+            else:
+                self._bad.discard(key)
+                self._count[v] -= 1
+                if self._count[v] == 0 and v in self._index:
+                    #swap the last variable into v's place
+                    i = self._index.pop(v)
+                    last = self._conflicted.pop()
+                    if last is not v:
+                        self._conflicted[i] = last
+                        self._index[last] = i
+
+    def update(self, var):
+        for c in self.csp.constraintsOf(var):
+            self._evaluate(c)
+
+    def conflicted(self):
+        '''list of the movable variables in conflict'''
+        return self._conflicted
+
+    def solved(self):
+        return len(self._bad) == 0
+
+def MinConflicts(csp, maxSteps=10000, tabu=10, noise=0.05, restarts=5, trace=False):
+    '''Min-conflicts local search over the current domains of the
+       variables. Starts from a greedy complete assignment (each
+       variable in turn takes a value with the fewest violations given
+       the variables already assigned) and then repeatedly picks a
+       random variable in conflict and moves it to the value with the
+       fewest violations (ties broken at random).
+
+       The violations of a value are the sum of cnstr.violations(var,
+       val) over the constraints of var, so constraints with counters
+       (e.g., NQueensConstraint) make each evaluation cheap, and
+       after a move the ConflictTable only re-evaluates the
+       constraints of the moved variable.
+
+       tabu: after leaving a value a variable can't go back to it for
+       that many steps (unless it has no violations).  noise: the
+       probability of moving to a random value instead (a random
+       walk step). If no solution is found in maxSteps steps the
+       search restarts from a new greedy assignment, up to restarts
+       times.
+
+       Returns a list with the solution found (as a list of (var,
+       value) pairs, like BT) or an empty list. The number of steps
+       is counted in bt_search.nodesExplored. Local search can't
+       find all solutions or prove there are none.'''
+    domains = dict()
+    for v in csp.variables():
+        domains[v] = v.curDomain()
+    movable = set([v for v in csp.variables() if len(domains[v]) > 1])
+    for attempt in range(restarts + 1):
+        csp.unAssignAllVars()
+        for v in csp.variables():
+            v.setValue(_minConflictsValue(csp, v, domains[v], None, True))
+        table = ConflictTable(csp, movable)
+        tabuUntil = dict()      #(var,val) --> step the pair is tabu until
+        for step in range(maxSteps):
+            if table.solved() or not table.conflicted():
+                break
+            bt_search.nodesExplored += 1
+            conflicted = table.conflicted()
+            var = conflicted[random.randint(0, len(conflicted) - 1)]
+            old = var.getValue()
+            if random.random() < noise:
+                val = random.choice([d for d in domains[var] if d != old])
+            else:
+                val = _minConflictsValue(csp, var, domains[var],
+                                         lambda d: tabuUntil.get((var, d), -1) >= step)
+            if val is None:
+                continue
+            tabuUntil[(var, old)] = step + tabu
+            var.setValue(val)
+            table.update(var)
+            if trace: print "==> step {}: {} = {} ({} in conflict)".format(
+                    step, var.name(), val, len(table.conflicted()))
+        if table.solved():
+            if trace: print "{} Solution Found".format(csp.name())
+            soln = [(v, v.getValue()) for v in csp.variables()]
+            csp.unAssignAllVars()
+            return [soln]
+        if trace: print "<==restarting after {} steps".format(maxSteps)
+    csp.unAssignAllVars()
+    return []
+
+def _minConflictsValue(csp, var, domain, isTabu, greedy=False):
+    '''Return a value in domain (other than the current value of
+       var) with the fewest violations, ignoring tabu values that have
+       some. With greedy, return the first value found without
+       violations, trying a few random values first.'''
+    cnstrs = csp.constraintsOf(var)
+    old = var.getValue()
+    if greedy:
+        for i in range(min(len(domain), 10)):
+            val = random.choice(domain)
+            if val != old and sum([c.violations(var, val) for c in cnstrs]) == 0:
+                return val
+    best = []
+    bestScore = None
+    for val in domain:
+        if val == old:
+            continue
+        score = 0
+        for c in cnstrs:
+            score += c.violations(var, val)
+        if score > 0 and isTabu and isTabu(val):
+            continue
+        if bestScore is None or score < bestScore:
+            best = [val]
+            bestScore = score
+        elif score == bestScore:
+            best.append(val)
+        if greedy and score == 0:
+            break
+    if not best:
+        return None
+    return random.choice(best)
+
+
+class SolutionProduct:
+    '''The solutions of a problem made of independent parts, kept as
+       the lists of solutions of each part and only combined when
+       asked for.
+
+       parts is a list with the list of solutions of each part and
+       combine a function of a list of solutions (one for each part)
+       returning the combined solution (by default the concatenation
+       of the lists of (var, value) pairs). Iterating generates the
+       combined solutions lazily, count() is the number of solutions
+       and product[i] is the i-th solution of the iteration.'''
+
+    def __init__(self, parts, combine=None):
+        self._parts = [list(p) for p in parts]
+        if combine is None:
+            combine = lambda solns: [pair for s in solns for pair in s]
+        self._combine = combine
+
+    def parts(self):
+        '''return the lists of solutions of the parts'''
+        return [list(p) for p in self._parts]
+
+    def count(self):
+        '''return the number of (combined) solutions (a long, it can
+           be too large for len)'''
+        n = 1L
+        for p in self._parts:
+            n *= len(p)
+        return n
+
+    def __len__(self):
+        #len fails above sys.maxsize, use count()
+        return int(self.count())
+
+    def __iter__(self):
+        for solns in itertools.product(*self._parts):
+            yield self._combine(list(solns))
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.count()
+        if not 0 <= i < self.count():
+            raise IndexError("solution index out of range")
+        solns = []
+        #the last part varies fastest, as in the iteration
+        for p in reversed(self._parts):
+            i, k = divmod(i, len(p))
+            solns.append(p[k])
+        solns.reverse()
+        return self._combine(solns)
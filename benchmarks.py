@@ -0,0 +1,117 @@
+import csp_problems
+from backtracking import bt_search
+import argparse
+import random
+import time
+
+#Benchmarks comparing different models and propagators on the same
+#problems. Each benchmark prints one line per problem size.
+
+def alldiff_queens(sizes, allSolns, varHeur):
+    '''Compare GAC and bounds consistency AllDiffConstraints on
+       n-queens modeled with three alldiff constraints'''
+    print "{:>6} {:>12} {:>10} {:>12} {:>10}".format(
+        "n", "gac nodes", "gac secs", "bounds nodes", "bounds secs")
+    for n in sizes:
+        row = [n]
+        for consistency in ['gac', 'bounds']:
+            csp = csp_problems.nQueensAllDiff(n, consistency)
+            start = time.time()
+            solutions, num_nodes = bt_search('GAC', csp, varHeur, allSolns, False)
+            row.extend([num_nodes, time.time() - start])
+        print "{:>6} {:>12} {:>10.3f} {:>12} {:>10.3f}".format(*row)
+
+def large_queens(sizes, allSolns, varHeur, nodeLimit=1000):
+    '''Propagation cost of the binary QueensConstraint model of
+       n-queens for large n: the time per node of FC and GAC, searching
+       up to nodeLimit nodes (a limit hit is marked with "+")'''
+    print "{:>6} {:>10} {:>10} {:>12} {:>10} {:>10} {:>12}".format(
+        "n", "fc nodes", "fc secs", "fc ms/node", "gac nodes", "gac secs", "gac ms/node")
+    for n in sizes:
+        row = [n]
+        for algo in ['FC', 'GAC']:
+            csp = csp_problems.nQueens(n, False)
+            start = time.time()
+            solutions, num_nodes = bt_search(algo, csp, varHeur, allSolns, False, nodeLimit)
+            secs = time.time() - start
+            limit = "+" if num_nodes >= nodeLimit else ""
+            row.extend(["{}{}".format(num_nodes, limit), secs, 1000 * secs / max(num_nodes, 1)])
+        print "{:>6} {:>10} {:>10.3f} {:>12.3f} {:>10} {:>10.3f} {:>12.3f}".format(*row)
+
+def _sudokuBoard(n, givens, rng):
+    '''An N x N sudoku board (N = n*n) keeping a fraction givens of the
+       cells of a shuffled pattern solution'''
+    N = n * n
+    digits = range(1, N + 1)
+    rng.shuffle(digits)
+    board = []
+    for i in range(N):
+        #row i is the pattern shifted by n for each row in the band
+        #and by 1 for each band
+        board.append([digits[(n*(i % n) + i // n + j) % N] if rng.random() < givens else 0
+                      for j in range(N)])
+    return board
+
+def sudoku_sizes(sizes, allSolns, varHeur, nodeLimit=10000):
+    '''Construction and solve times of sudoku boards with n x n
+       sub-squares (sizes are the n's) with half the cells given,
+       for both models under FC and GAC. Searches giving up after
+       nodeLimit nodes are marked with a +.'''
+    print "{:>4} {:>8} {:>8} {:>10} {:>10} {:>10} {:>10} {:>10} {:>10}".format(
+        "n", "model", "vars", "cnstrs", "build secs", "fc nodes", "fc secs", "gac nodes", "gac secs")
+    for n in sizes:
+        board = _sudokuBoard(n, 0.5, random.Random(n))
+        for model in ['neq', 'alldiff']:
+            start = time.time()
+            csp = csp_problems.sudokuCSP(board, model)
+            row = [n, model, len(csp.variables()), len(csp.constraints()), time.time() - start]
+            for algo in ['FC', 'GAC']:
+                csp = csp_problems.sudokuCSP(board, model)
+                start = time.time()
+                solutions, num_nodes = bt_search(algo, csp, varHeur, allSolns, False, nodeLimit)
+                if num_nodes >= nodeLimit:
+                    num_nodes = "{}+".format(num_nodes)
+                row.extend([num_nodes, time.time() - start])
+            print "{:>4} {:>8} {:>8} {:>10} {:>10.3f} {:>10} {:>10.3f} {:>10} {:>10.3f}".format(*row)
+
+def sudoku_template(sizes, allSolns, varHeur, boards=10):
+    '''Per board cost of building the sudoku CSP from scratch with
+       sudokuCSP and of loading the board into a SudokuTemplate, for
+       boards with n x n sub-squares (sizes are the n's), and the GAC
+       search time per board for comparison'''
+    print "{:>4} {:>8} {:>10} {:>10} {:>10} {:>8} {:>10}".format(
+        "n", "model", "cnstrs", "build ms", "load ms", "speedup", "gac ms")
+    for n in sizes:
+        rng = random.Random(n)
+        batch = [_sudokuBoard(n, 0.5, rng) for i in range(boards)]
+        for model in ['neq', 'alldiff']:
+            start = time.time()
+            for board in batch:
+                csp = csp_problems.sudokuCSP(board, model)
+            build = (time.time() - start) / boards
+            template = csp_problems.SudokuTemplate(n, model)
+            start = time.time()
+            for board in batch:
+                template.load(board)
+            load = (time.time() - start) / boards
+            start = time.time()
+            for board in batch:
+                bt_search('GAC', template.load(board), varHeur, allSolns, False)
+            search = (time.time() - start) / boards - load
+            print "{:>4} {:>8} {:>10} {:>10.3f} {:>10.3f} {:>8.0f} {:>10.3f}".format(
+                n, model, len(csp.constraints()), 1000*build, 1000*load, build / load, 1000*search)
+
+benchmarks = {'alldiff-queens': alldiff_queens,
+              'large-queens': large_queens,
+              'sudoku-template': sudoku_template,
+              'sudoku-sizes': sudoku_sizes}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a CSP benchmark')
+    parser.add_argument("benchmark", help="The benchmark to run", choices=sorted(benchmarks.keys()))
+    parser.add_argument("sizes", help="The problem sizes to run", type=int, nargs='+')
+    parser.add_argument("-c", "--allSolns", help="Complete search (Find all solutions)", action="store_true")
+    parser.add_argument("-v", "--varHeur", help="Heuristic for selecting next variable to assign", choices=['fixed', 'random', 'mrv'], default='mrv')
+    args = parser.parse_args()
+
+    benchmarks[args.benchmark](args.sizes, args.allSolns, args.varHeur)
@@ -1,5 +1,209 @@
 from csp import Constraint, Variable
 import util
+import bisect
+import itertools
+import operator
+import weakref
+
+class Table:
+    '''Immutable, indexed set of satisfying tuples that can be shared by
+       many TableConstraints.
+
+       The tuples are not computed until the table is first used: the
+       table is created with a builder function (taking no arguments
+       and returning a list of tuples/lists) and calls it on the
+       first access. After that the table holds
+
+       a) the tuples themselves (as a tuple of tuples),
+       b) a set of the tuples for constant time membership tests, and
+       c) an index, built position by position on demand, mapping
+          (position, value) to the tuples that have that value at that
+          position.
+
+       Tables are never modified once built, so any number of
+       constraints can use the same Table object. Use TableRegistry
+       to obtain shared tables.'''
+
+    def __init__(self, builder):
+        self._builder = builder
+        self._tuples = None
+        self._set = None
+        self._index = dict()
+
+    def _build(self):
+        if self._tuples is None:
+            self._tuples = tuple(tuple(t) for t in self._builder())
+            self._set = frozenset(self._tuples)
+            self._builder = None   #let go of whatever the builder references
+
+    def isBuilt(self):
+        return self._tuples is not None
+
+    def tuples(self):
+        '''return the satisfying tuples (as a tuple of tuples)'''
+        self._build()
+        return self._tuples
+
+    def size(self):
+        return len(self.tuples())
+
+    def contains(self, assignment):
+        '''is the tuple (or list) assignment one of the satisfying tuples'''
+        self._build()
+        return tuple(assignment) in self._set
+
+    def supports(self, pos, val):
+        '''return the tuples that have value val at position pos'''
+        self._build()
+        if pos not in self._index:
+            idx = dict()
+            for t in self._tuples:
+                if t[pos] in idx:
+                    idx[t[pos]].append(t)
+                else:
+                    idx[t[pos]] = [t]
+            self._index[pos] = idx
+        return self._index[pos].get(val, [])
+
+class TableRegistry:
+    '''Registry of shared Table objects.
+
+       lookup(key, builder) returns the table registered under key,
+       creating a lazily built table from builder if there is none.
+       The key must determine the table's tuples (e.g., for the queens
+       tables the two domains and the row distance).
+
+       intern(tuples) returns the shared table holding exactly the
+       passed tuples, so identical explicit tuple lists are stored
+       only once.
+
+       Tables are only held weakly, they disappear once no constraint
+       uses them.'''
+
+    _byKey = weakref.WeakValueDictionary()
+    _byContents = weakref.WeakValueDictionary()
+
+    @staticmethod
+    def lookup(key, builder):
+        table = TableRegistry._byKey.get(key)
+        if table is None:
+            table = Table(builder)
+            TableRegistry._byKey[key] = table
+        return table
+
+    @staticmethod
+    def intern(tuples):
+        contents = frozenset(tuple(t) for t in tuples)
+        table = TableRegistry._byContents.get(contents)
+        if table is None:
+            table = Table(lambda: contents)
+            table._build()
+            TableRegistry._byContents[contents] = table
+        return table
+
+class PropagatorConstraint(Constraint):
+    '''Base class for constraints with a dedicated filtering algorithm.
+
+       Instead of searching for a support of each (var,val) pair
+       separately (as findvals does), these constraints compute the
+       supported values of every variable in their scope in a single
+       call to filter(). hasSupport answers from the result of the
+       last call, and filter() is only called again when the current
+       domains have changed in a way that could change the answer.
+
+       Subclasses must implement check() and filter(domains). domains
+       is a list of sets, the current domains of the scope variables
+       in scope order (an assigned variable has just its value). filter
+       returns a list of sets, for each variable the values that have
+       a support (all empty if the constraint can't be satisfied).
+       filter may keep internal state between calls (e.g., to repair
+       a previous result incrementally) but it must not assume that
+       the domains only shrink, search backtracks.
+
+       Subclasses whose filtering is exact at least when a single
+       variable of the scope is unassigned (the values left unpruned
+       are exactly the values with a support, e.g., GAC) set
+       exactSupports to True. FC then prunes the last unassigned
+       variable with unsupportedValues instead of trying every value
+       with check.'''
+
+    exactSupports = False
+
+    def __init__(self, name, scope):
+        Constraint.__init__(self, name, scope)
+        self._position = dict()
+        for i, v in enumerate(self._scope):
+            self._position[v] = i
+        self._supported = None    #result of the last filter() call
+        self._inDoms = None       #domains passed to that call
+        self._stamps = None       #variable stamps when the result was (re)validated
+        self._clock = None        #Variable.clock() when the result was (re)validated
+
+    def filter(self, domains):
+        util.raiseNotDefined()
+
+    def hasSupport(self, var, val):
+        '''check if var=val has an extension to an assignment of the
+           other variables in the constraint that satisfies the constraint'''
+        if var not in self._position:
+            return True   #var=val has support on any constraint it does not participate in
+        return val in self.supportedValues()[self._position[var]]
+
+    def supportedValues(self):
+        '''return a list of sets (in scope order) of the values that
+           have a support given the current domains'''
+        if not self._cacheValid():
+            doms = [set(v.curDomain()) for v in self._scope]
+            self._supported = self.filter(doms)
+            self._inDoms = doms
+            self._stamps = [v.stamp() for v in self._scope]
+        self._clock = Variable.clock()
+        return self._supported
+
+    def unsupportedValues(self):
+        '''return a list (in scope order) of the lists of the values in
+           the current domains that have no support. Subclasses can
+           override this when they find these values without testing
+           every value.'''
+        supported = self.supportedValues()
+        return [[val for val in v.curDomain() if val not in supported[i]]
+                for i, v in enumerate(self._scope)]
+
+    def _cacheValid(self):
+        #If the last call computed supported(D) from domains D, that is
+        #still the answer for the current domains D' whenever
+        #supported(D) <= D' <= D for every variable. This happens, e.g.,
+        #when GacEnforce prunes the values the last call found unsupported.
+        if self._supported is None:
+            return False
+        if self._clock == Variable.clock():
+            return True
+        for i, v in enumerate(self._scope):
+            if v.stamp() != self._stamps[i]:
+                cur = set(v.curDomain())
+                if not (self._supported[i] <= cur <= self._inDoms[i]):
+                    return False
+                self._stamps[i] = v.stamp()
+        return True
+
+
+class PruningConstraint(Constraint):
+    '''Base class for constraints that prune the current domains of
+       their variables themselves, for constraints with so many
+       variables that testing every value with hasSupport is too slow.
+
+       Subclasses must implement check(), hasSupport(var, val) and
+       prune(reasonVar, reasonVal). prune removes the values it finds
+       unsupported with var.pruneValue(val, reasonVar, reasonVal), so
+       that the search undoes the pruning when it undoes the
+       assignment reasonVar=reasonVal, and returns "DWO" or the list
+       of variables whose current domain it changed. GacEnforce calls
+       prune instead of hasSupport, and FC calls it after every
+       assignment to a variable in the scope.'''
+
+    def prune(self, reasonVar, reasonVal):
+        util.raiseNotDefined()
+
 
 class TableConstraint(Constraint):
     '''General type of constraint that can be use to implement any type of
@@ -31,11 +235,35 @@ class TableConstraint(Constraint):
                                 [4, 2, 3, 1], [4, 3, 1, 2], [4, 3, 2, 1]])
           as these are the only assignments to A,B,C respectively that
           satisfy alldiff(A,B,C,D)
+
+          satisfyingAssignments can also be a Table object (see
+          TableRegistry) in which case the table is shared with any
+          other constraint using it. A list of satisfying assignments
+          is interned in the TableRegistry.
         '''
 
         Constraint.__init__(self,name, scope)
         self._name = "TableCnstr_" + name
-        self.satAssignments = satisfyingAssignments
+        if isinstance(satisfyingAssignments, Table):
+            self._table = satisfyingAssignments
+        else:
+            self._table = TableRegistry.intern(satisfyingAssignments)
+
+    def table(self):
+        '''return the (shared) Table of satisfying tuples'''
+        return self._table
+
+    def signature(self):
+        #equal lists of tuples are interned as the same Table
+        return ('table', self._table)
+
+    def setTable(self, satisfyingAssignments):
+        '''replace the satisfying assignments (a list or a Table, as
+           passed to __init__)'''
+        if isinstance(satisfyingAssignments, Table):
+            self._table = satisfyingAssignments
+        else:
+            self._table = TableRegistry.intern(satisfyingAssignments)
 
     def check(self):
         '''check if current variable assignments are in the satisfying set'''
@@ -45,7 +273,7 @@ class TableConstraint(Constraint):
                 assignments.append(v.getValue())
             else:
                 return True
-        return assignments in self.satAssignments
+        return self._table.contains(assignments)
 
     def hasSupport(self, var,val):
         '''check if var=val has an extension to an assignment of all variables in
@@ -55,10 +283,9 @@ class TableConstraint(Constraint):
             return True   #var=val has support on any constraint it does not participate in
         vindex = self.scope().index(var)
         found = False
-        for assignment in self.satAssignments:
-            if assignment[vindex] != val:
-                continue   #this assignment can't work it doesn't make var=val
-            found = True   #Otherwise it has potential. Assume found until shown otherwise
+        #the table index only gives us the assignments that make var=val
+        for assignment in self._table.supports(vindex, val):
+            found = True   #This assignment has potential. Assume found until shown otherwise
             for i, v in enumerate(self.scope()):
                 if i != vindex and not v.inCurDomain(assignment[i]):
                     found = False  #Bummer...this assignment didn't work it assigns
@@ -69,11 +296,48 @@ class TableConstraint(Constraint):
         return found     #either way found has the right truth value
 
 
-class QueensConstraint(Constraint):
-    '''Queens constraint between queen in row i and row j'''
+class _QueenSupports(object):
+    '''The supported columns of a row of a QueensConstraint, as a
+       bitmask of the unsupported ones: column val is unsupported iff
+       bit val - base of conflict is set. Only membership tests are
+       supported (which is all the search uses).'''
+    __slots__ = ['conflict', 'base']
+
+    def __init__(self, conflict, base):
+        self.conflict = conflict
+        self.base = base
+
+    def __contains__(self, val):
+        shift = val - self.base
+        return shift < 0 or not (self.conflict >> shift) & 1
+
+class QueensConstraint(PropagatorConstraint):
+    '''Queens constraint between queen in row i and row j
+
+       Propagation works on the whole domain at once. A column c of
+       one row only conflicts with the columns c, c+d and c-d of the
+       other row (d = |i-j|), so if the other row has 4 or more
+       columns left every column has a support. Otherwise the
+       unsupported columns are those in every conflict set of the
+       other row's columns, computed as the AND of the bitmasks
+       (1<<c)|(1<<(c+d))|(1<<(c-d)).
+
+       supportedValues answers with that bitmask (see _QueenSupports)
+       instead of sets of columns, so each call takes constant time:
+       it only looks at the size of the other row's domain and, when
+       it has at most 3 columns, at those columns, and
+       unsupportedValues decodes the (at most 3) unsupported columns
+       from the bitmask, so GacEnforce and FC never scan a domain.
+       For the same reason pruning a row that keeps 4 or more columns
+       can't remove supports, and recheckSize keeps GacEnforce from
+       requeueing the row's n-1 constraints.'''
+
+    exactSupports = True
+    recheckSize = 3
+
     def __init__(self, name, qi, qj, i, j):
         scope = [qi, qj]
-        Constraint.__init__(self,name, scope)
+        PropagatorConstraint.__init__(self,name, scope)
         self._name = "QueenCnstr_" + name
         self.i = i
         self.j = j
@@ -88,20 +352,68 @@ class QueensConstraint(Constraint):
     def queensCheck(self, vali, valj):
         diag = abs(vali - valj) == abs(self.i - self.j)
         return not diag and vali != valj
-    def hasSupport(self, var, val):
-        '''check if var=val has an extension to an assignment of the
-           other variable in the constraint that satisfies the constraint'''
-        #hasSupport for this constraint is easier as we only have one
-        #other variable in the constraint.
-        if var not in self.scope():
-            return True   #var=val has support on any constraint it does not participate in
-        otherVar = self.scope()[0]
-        if otherVar == var:
-            otherVar = self.scope()[1]
-        for otherVal in otherVar.curDomain():
-            if self.queensCheck(val, otherVal):
-                return True
-        return False
+
+    def signature(self):
+        return ('queens', abs(self.i - self.j))
+
+    def _conflict(self, cols):
+        #(conflict, base): bit c - base of conflict is set iff column c
+        #conflicts with every column in cols
+        d = abs(self.i - self.j)
+        base = min(cols) - d     #so all shifts are >= 0
+        conflict = -1     #all ones
+        for c in cols:
+            c -= base
+            conflict &= (1 << c) | (1 << (c + d)) | (1 << (c - d))
+        return conflict, base
+
+    def _supports(self, other):
+        if other.curDomainSize() >= 4:
+            return _QueenSupports(0, 0)
+        cols = other.curDomain()
+        if not cols:
+            return frozenset()
+        conflict, base = self._conflict(cols)
+        return _QueenSupports(conflict, base)
+
+    def supportedValues(self):
+        qi, qj = self._scope
+        return [self._supports(qj), self._supports(qi)]
+
+    def _unsupported(self, var, other):
+        if other.curDomainSize() >= 4:
+            return []
+        cols = other.curDomain()
+        if not cols:
+            return var.curDomain()
+        conflict, base = self._conflict(cols)
+        vals = []
+        while conflict:     #at most 3 bits
+            bit = conflict & -conflict
+            conflict ^= bit
+            val = base + bit.bit_length() - 1
+            if var.inCurDomain(val):
+                vals.append(val)
+        return vals
+
+    def unsupportedValues(self):
+        qi, qj = self._scope
+        return [self._unsupported(qi, qj), self._unsupported(qj, qi)]
+
+    def filter(self, domains):
+        supported = []
+        for k in [0, 1]:
+            dom = domains[k]
+            other = domains[1-k]
+            if len(other) >= 4:
+                supported.append(dom)
+                continue
+            if not dom or not other:
+                supported.append(set())
+                continue
+            conflict, base = self._conflict(other)
+            supported.append(set([val for val in dom if val in _QueenSupports(conflict, base)]))
+        return supported
 
 class QueensTableConstraint(TableConstraint):
     '''Queens constraint between queen in row i and row j, but
@@ -114,13 +426,20 @@ class QueensTableConstraint(TableConstraint):
 
        Then we get hasSupport and check automatically from
        TableConstraint
+
+       The tuples only depend on the two domains and on |i-j|, so
+       all pairs of rows with the same distance share one table
+       from the TableRegistry (built the first time it is used).
     '''
     #your implementation for Question 1 goes
     #inside of this class body. You must not change
     #the existing function signatures.
     def __init__(self, name, qi, qj, i, j):
         self._name = "Queen_" + name
-        TableConstraint.__init__(self, name, [qi, qj], self.satisfyingAssignments(qi, qj, i, j))
+        key = ('queens', tuple(qi.domain()), tuple(qj.domain()), abs(i - j))
+        table = TableRegistry.lookup(
+            key, lambda: self.satisfyingAssignments(qi, qj, i, j))
+        TableConstraint.__init__(self, name, [qi, qj], table)
     
     # Generate the satisfying tuples, assuming i != j
     def satisfyingAssignments(self, qi, qj, i, j):
@@ -134,6 +453,139 @@ class QueensTableConstraint(TableConstraint):
 
 
 
+_stampOf = operator.attrgetter('_stamp')   #Variable.stamp() without a method call
+
+class NQueensConstraint(PruningConstraint):
+    '''All the constraints of the n-queens problem as one constraint.
+       queens[r-1] is the queen of row r and its values are columns.
+
+       The assigned queens are counted per column, diagonal (column -
+       row) and anti-diagonal (column + row). The counts are updated
+       for the rows whose stamp changed since the last call, so check
+       and hasSupport only look at three counters.
+
+       level 'fc' prunes from the unassigned rows the columns attacked
+       by the newly assigned queens, the pruning FC does with the
+       pairwise constraints. level 'gac' makes the pairwise
+       constraints arc consistent: column c of row j has no support
+       in row k only when every column left in row k attacks c, which
+       needs row k to have 3 or fewer columns. So every row left with
+       3 or fewer columns prunes the columns they all attack from the
+       other rows, until no more rows are left that small.'''
+
+    def __init__(self, name, queens, level='gac'):
+        if level not in ['fc', 'gac']:
+            print "Error NQueensConstraint given an illegal level {}. Must be one of 'fc' or 'gac'".format(level)
+        Constraint.__init__(self, name, queens)
+        self._name = "NQueens_" + name
+        self._level = level
+        self._position = dict()
+        for r, q in enumerate(self._scope):
+            self._position[q] = r
+        self._row = [None] * len(queens)    #column counted for each row
+        self._seen = [None] * len(queens)   #stamp of each row when last looked at
+        self._cols = dict()
+        self._diags = dict()
+        self._antis = dict()
+        self._clashes = 0   #pairs of counted queens attacking each other
+        self._synced = None #Variable.clock() when the counts were updated
+
+    def _count(self, counts, key, inc):
+        n = counts.get(key, 0)
+        if inc > 0 and n > 0:
+            self._clashes += 1
+        elif inc < 0 and n > 1:
+            self._clashes -= 1
+        counts[key] = n + inc
+
+    def _place(self, r, c, inc):
+        self._count(self._cols, c, inc)
+        self._count(self._diags, c - r, inc)
+        self._count(self._antis, c + r, inc)
+
+    def _sync(self):
+        '''update the counts for the rows that changed since the last
+           call, return the list of changed rows'''
+        if self._synced == Variable.clock():
+            return []
+        #compare all the stamps without a Python loop, usually few change
+        stamps = map(_stampOf, self._scope)
+        changed = list(itertools.compress(xrange(len(stamps)),
+                                          itertools.imap(operator.ne, stamps, self._seen)))
+        self._seen = stamps
+        for r in changed:
+            q = self._scope[r]
+            if self._row[r] != q.getValue():
+                if self._row[r] is not None:
+                    self._place(r, self._row[r], -1)
+                self._row[r] = q.getValue()
+                if self._row[r] is not None:
+                    self._place(r, self._row[r], 1)
+        self._synced = Variable.clock()
+        return changed
+
+    def check(self):
+        self._sync()
+        return self._clashes == 0
+
+    def hasSupport(self, var, val):
+        '''var=val is not attacked by an assigned queen'''
+        return var not in self._position or self.violations(var, val) == 0
+
+    def violations(self, var, val):
+        '''the number of assigned queens (other than var) attacking var=val'''
+        self._sync()
+        r = self._position[var]
+        own = 3 if self._row[r] == val else 0
+        return (self._cols.get(val, 0) + self._diags.get(val - r, 0)
+                + self._antis.get(val + r, 0) - own)
+
+    def prune(self, reasonVar, reasonVal):
+        changed = self._sync()
+        if self._clashes > 0:
+            return "DWO"
+        if self._level == 'fc':
+            rows = [r for r in changed if self._row[r] is not None]
+        else:
+            rows = [r for r in changed if self._scope[r].curDomainSize() <= 3]
+        queued = set(rows)
+        pruned = set()
+        while rows:
+            k = rows.pop()
+            queued.discard(k)
+            cols = self._scope[k].curDomain()
+            if not cols:
+                return "DWO"
+            for j, q in enumerate(self._scope):
+                if j == k:
+                    continue
+                d = abs(j - k)
+                c = cols[0]
+                if len(cols) == 1:
+                    attacked = (c, c + d, c - d)
+                else:
+                    attacked = [v for v in (c, c + d, c - d)
+                                if all(abs(v - o) in (0, d) for o in cols)]
+                if q.isAssigned():
+                    if q.getValue() in attacked:
+                        return "DWO"
+                    continue
+                for v in attacked:
+                    if q.inCurDomain(v):
+                        q.pruneValue(v, reasonVar, reasonVal)
+                        pruned.add(q)
+                        size = q.curDomainSize()
+                        if size == 0:
+                            return "DWO"
+                        if self._level == 'gac' and size <= 3 and j not in queued:
+                            rows.append(j)
+                            queued.add(j)
+        #our own pruning is already propagated
+        self._seen = map(_stampOf, self._scope)
+        self._synced = Variable.clock()
+        return list(pruned)
+
+
 class NeqConstraint(Constraint):
     '''Neq constraint between two variables'''
     def __init__(self, name, scope):
@@ -142,6 +594,9 @@ class NeqConstraint(Constraint):
         Constraint.__init__(self,name, scope)
         self._name = "NeqCnstr_" + name
 
+    def signature(self):
+        return ('neq',)
+
     def check(self):
         v0 = self.scope()[0]
         v1 = self.scope()[1]
@@ -164,49 +619,429 @@ class NeqConstraint(Constraint):
                 return True
         return False
 
-class AllDiffConstraint(Constraint):
-    '''All diff constraint between a set of variables'''
-    def __init__(self, name, scope):
-        Constraint.__init__(self,name, scope)
+class _AllBut(object):
+    '''The supported values of a variable given by its unsupported
+       ones: any value of the current domain not in unsupported. Only
+       membership tests are supported.'''
+    __slots__ = ['unsupported']
+
+    def __init__(self, unsupported):
+        self.unsupported = unsupported
+
+    def __contains__(self, val):
+        return val not in self.unsupported
+
+class AllDiffConstraint(PropagatorConstraint):
+    '''All diff constraint between a set of variables
+
+       GAC is enforced with Regin's algorithm. The variables and the
+       values of their current domains form a bipartite graph, and
+       the constraint is satisfiable iff this graph has a matching
+       covering every variable. Given such a maximum matching, an edge
+       var=val has a support iff it is in the matching, or it lies on
+       an even alternating path starting from a free (unmatched) value,
+       or var and val are in the same strongly connected component of
+       the residual graph (matched edges oriented var->val, all other
+       edges val->var). So one matching plus one SCC computation
+       filters the whole constraint in polynomial time.
+
+       The matching is kept between calls and repaired: pairs whose
+       value has been pruned are dropped and only the variables left
+       unmatched are re-augmented.
+
+       With consistency='bounds' only bounds consistency is enforced,
+       using the Hall interval algorithm of Lopez-Ortiz et al.
+       (O(n log n) per pass). Only the bounds of each variable
+       (shifted by its offset) are used, no domain sets are built: the
+       values of the assigned variables are removed from the value
+       axis, the intervals of the unassigned variables over the
+       remaining values are tightened, and unsupportedValues lists the
+       values outside the tightened bounds and the values of the
+       assigned variables. A bound that falls on a hole of its domain
+       moves to the next value and the bounds are tightened again
+       until they are stable. With one variable left unassigned this
+       is exact, as FC needs. This needs integer values. It propagates
+       less than GAC when holes matter (e.g., n-queens needs a few
+       more nodes) but each call is cheaper.
+
+       If offsets is given (a list of integers, one per variable)
+       the constraint is that the values scope[i] + offsets[i] are
+       all different, e.g., the diagonals of n-queens.'''
+    def __init__(self, name, scope, consistency='gac', offsets=None):
+        PropagatorConstraint.__init__(self,name, scope)
         self._name = "AllDiff_" + name
+        if consistency not in ['gac', 'bounds']:
+            print "Error AllDiffConstraint given an illegal consistency {}. Must be one of {}".format(consistency, ['gac', 'bounds'])
+        self._consistency = consistency
+        self.exactSupports = True   #bounds too, see unsupportedValues
+        self._offsets = offsets
+        self._match = [None]*len(self._scope)     #var index --> matched value
+
+    def signature(self):
+        return ('alldiff', tuple(self._offsets) if self._offsets else None)
 
     def check(self):
         assignments = []
-        for v in self.scope():
+        for i, v in enumerate(self.scope()):
             if v.isAssigned():
-                assignments.append(v.getValue())
+                if self._offsets:
+                    assignments.append(v.getValue() + self._offsets[i])
+                else:
+                    assignments.append(v.getValue())
             else:
                 return True
         return len(set(assignments)) == len(assignments)
 
-    def hasSupport(self, var, val):
-        '''check if var=val has an extension to an assignment of the
-           other variable in the constraint that satisfies the constraint'''
-        if var not in self.scope():
-            return True   #var=val has support on any constraint it does not participate in
+    def violations(self, var, val):
+        '''the number of other assigned variables clashing with var=val'''
+        k = self._position[var]
+        if self._offsets:
+            val += self._offsets[k]
+        found = 0
+        for i, v in enumerate(self._scope):
+            if i != k and v.isAssigned():
+                other = v.getValue()
+                if self._offsets:
+                    other += self._offsets[i]
+                if other == val:
+                    found += 1
+        return found
+
+    def unsupportedValues(self):
+        if self._consistency != 'bounds':
+            return PropagatorConstraint.unsupportedValues(self)
+        scope = self._scope
+        offsets = self._offsets or [0]*len(scope)
+        fail = [v.curDomain() for v in scope]
+        #The values taken by the assigned variables are left out of the
+        #value axis: the unassigned variables' intervals are filtered
+        #over the ranks of the free values.
+        taken = []
+        free = []
+        for i, v in enumerate(scope):
+            if v.isAssigned():
+                taken.append(v.getValue() + offsets[i])
+            else:
+                free.append(i)
+        taken.sort()
+        takenSet = set(taken)
+        if len(takenSet) < len(taken):
+            return fail
+        gaps = [t - k for k, t in enumerate(taken)]    #rank r is value r + #(gaps <= r)
+
+        def snap(i, l, h):
+            #the bounds of var i moved inwards onto free values of its domain
+            var = scope[i]
+            off = offsets[i]
+            while l <= h and (l in takenSet or not var.inCurDomain(l - off)):
+                l += 1
+            while h >= l and (h in takenSet or not var.inCurDomain(h - off)):
+                h -= 1
+            return l, h
+
+        lo = []
+        hi = []
+        for i in free:
+            if scope[i].curDomainSize() == 0:
+                return fail
+            l, h = scope[i].curBounds()
+            l, h = snap(i, l + offsets[i], h + offsets[i])
+            if l > h:
+                return fail
+            lo.append(l)
+            hi.append(h)
+        while free:
+            rlo = [l - bisect.bisect_left(taken, l) for l in lo]
+            rhi = [h - bisect.bisect_left(taken, h) for h in hi]
+            newlo = _hallFilterLower(rlo, rhi)
+            newhi = newlo and _hallFilterLower([-h for h in rhi], [-l for l in rlo])
+            if newhi is None:
+                return fail
+            changed = False
+            for k, i in enumerate(free):
+                if newlo[k] == rlo[k] and -newhi[k] == rhi[k]:
+                    continue
+                l = newlo[k] + bisect.bisect_right(gaps, newlo[k])
+                h = -newhi[k] + bisect.bisect_right(gaps, -newhi[k])
+                #bounds landing on holes of the domain move on, and the
+                #intervals are filtered again until they are stable
+                l, h = snap(i, l, h)
+                if l > h:
+                    return fail
+                lo[k] = l
+                hi[k] = h
+                changed = True
+            if not changed:
+                break
 
-        #since the contraint has many variables use the helper function 'findvals'
-        #for that we need two test functions
-        #1. for testing complete assignments to the constraint's scope
-        #   return True if and only if the complete assignment satisfies the constraint
-        #2. for testing partial assignments to see if they could possibly work.
-        #   return False if the partial assignment cannot be extended to a satisfying complete
-        #   assignment
-        #
-        #Function #2 is only needed for efficiency (sometimes don't have one)
-        #  if it isn't supplied findvals will use a function that never returns False
-        #
-        #For alldiff, we do have both functions! And they are the same!
-        #We just check if the assignments are all to different values. If not return False
-        def valsNotEqual(l):
-            '''tests a list of assignments which are pairs (var,val)
-               to see if they can satisfy the all diff'''
-            vals = [val for (var, val) in l]
-            return len(set(vals)) == len(vals)
-        varsToAssign = self.scope()
-        varsToAssign.remove(var)
-        x = findvals(varsToAssign, [(var, val)], valsNotEqual, valsNotEqual)
-        return x
+        unsupported = [[] for v in scope]
+        for k, i in enumerate(free):
+            var = scope[i]
+            off = offsets[i]
+            l, h = var.curBounds()
+            vals = [val for val in range(l, lo[k] - off) if var.inCurDomain(val)]
+            vals.extend([t - off for t in taken[bisect.bisect_left(taken, lo[k]):
+                                                 bisect.bisect_right(taken, hi[k])]
+                         if var.inCurDomain(t - off)])
+            vals.extend([val for val in range(hi[k] - off + 1, h + 1) if var.inCurDomain(val)])
+            unsupported[i] = vals
+        return unsupported
+
+    def supportedValues(self):
+        if self._consistency != 'bounds':
+            return PropagatorConstraint.supportedValues(self)
+        return [_AllBut(set(vals)) for vals in self.unsupportedValues()]
+
+    def filter(self, domains):
+        offsets = self._offsets
+        if offsets:
+            domains = [set([val + offsets[i] for val in d]) for i, d in enumerate(domains)]
+        if self._consistency == 'bounds':
+            supported = self._filterBounds(domains)
+        else:
+            supported = self._filterGac(domains)
+        if offsets:
+            supported = [set([val - offsets[i] for val in d]) for i, d in enumerate(supported)]
+        return supported
+
+    def _filterGac(self, domains):
+        n = len(domains)
+        match = self._match
+        owner = dict()        #value --> var index matched to it
+        for i in range(n):
+            if match[i] is not None and match[i] in domains[i] and match[i] not in owner:
+                owner[match[i]] = i
+            else:
+                match[i] = None
+        for i in range(n):
+            if match[i] is None and not self._augment(i, domains, match, owner):
+                return [set() for d in domains]   #no matching covers all the variables
+
+        holders = dict()      #value --> var indicies with value in their domain
+        for i in range(n):
+            for val in domains[i]:
+                if val in holders:
+                    holders[val].append(i)
+                else:
+                    holders[val] = [i]
+
+        #Edges in an even alternating path from a free value. Free
+        #values only have edges val->var in the residual graph and
+        #from var we can only continue along its matched edge.
+        #A matched value is reached iff its variable is.
+        reached = set()
+        stack = []
+        for val in holders:
+            if val not in owner:
+                stack.extend(holders[val])
+        while stack:
+            i = stack.pop()
+            if i in reached:
+                continue
+            reached.add(i)
+            stack.extend([j for j in holders[match[i]] if j not in reached])
+
+        comp = self._sccs(domains, match, holders)
+        supported = []
+        for i in range(n):
+            sup = set()
+            for val in domains[i]:
+                if val == match[i] or val not in owner or owner[val] in reached \
+                   or comp[owner[val]] == comp[i]:
+                    sup.add(val)
+            supported.append(sup)
+        return supported
+
+    def _filterBounds(self, domains):
+        n = len(domains)
+        doms = [d for d in domains]
+        while True:
+            if not all(doms):
+                return [set() for d in domains]
+            lo = [min(d) for d in doms]
+            hi = [max(d) for d in doms]
+            newlo = _hallFilterLower(lo, hi)
+            if newlo is None:
+                return [set() for d in domains]
+            newhi = _hallFilterLower([-h for h in hi], [-l for l in lo])
+            if newhi is None:
+                return [set() for d in domains]
+            newhi = [-h for h in newhi]
+            changed = False
+            for i in range(n):
+                if newlo[i] > lo[i] or newhi[i] < hi[i]:
+                    doms[i] = set([val for val in doms[i] if newlo[i] <= val <= newhi[i]])
+                    changed = True
+            #pruning the bounds can expose holes in the domains,
+            #go around again until the bounds are stable
+            if not changed:
+                return doms
+
+    def _augment(self, i, domains, match, owner):
+        '''find an alternating path from the free variable i to a free
+           value (breadth first), and flip it. Return False if there is none'''
+        parent = dict()       #value --> (var index that reached it)
+        queue = [i]
+        for x in queue:
+            for val in domains[x]:
+                if val in parent:
+                    continue
+                parent[val] = x
+                if val not in owner:
+                    #flip the path back to i
+                    while True:
+                        x = parent[val]
+                        prev = match[x]
+                        match[x] = val
+                        owner[val] = x
+                        if x == i:
+                            return True
+                        val = prev
+                queue.append(owner[val])
+        return False
+
+    def _sccs(self, domains, match, holders):
+        '''Strongly connected components of the residual graph
+           restricted to the matched values, contracted onto the
+           variables: var i -> var j iff match[i] in domains[j] and i != j.
+           Values not in the matching can't be in a cycle so leaving
+           them out doesn't change the components of the variables.
+           Returns a list mapping each var index to its component.'''
+        n = len(domains)
+        succ = [[j for j in holders[match[i]] if j != i] for i in range(n)]
+        return _stronglyConnected(succ)
+
+
+def _stronglyConnected(succ):
+    '''Tarjan's algorithm (iterative, so deep graphs don't hit the
+       recursion limit). succ[v] is the list of successors of node v,
+       nodes are 0..len(succ)-1. Returns a list mapping each node to
+       the number of its strongly connected component.'''
+    n = len(succ)
+    index = [None]*n
+    low = [0]*n
+    comp = [None]*n
+    onstack = [False]*n
+    stack = []
+    counter = 0
+    ncomp = 0
+    for root in range(n):
+        if index[root] is not None:
+            continue
+        work = [(root, 0)]
+        while work:
+            v, k = work.pop()
+            if k == 0:
+                index[v] = low[v] = counter
+                counter += 1
+                stack.append(v)
+                onstack[v] = True
+            recurse = False
+            while k < len(succ[v]):
+                w = succ[v][k]
+                k += 1
+                if index[w] is None:
+                    work.append((v, k))
+                    work.append((w, 0))
+                    recurse = True
+                    break
+                elif onstack[w]:
+                    low[v] = min(low[v], index[w])
+            if recurse:
+                continue
+            if low[v] == index[v]:
+                while True:
+                    w = stack.pop()
+                    onstack[w] = False
+                    comp[w] = ncomp
+                    if w == v:
+                        break
+                ncomp += 1
+            if work:
+                u = work[-1][0]
+                low[u] = min(low[u], low[v])
+    return comp
+
+def _hallFilterLower(lo, hi):
+    '''Bounds consistency for alldiff over the intervals [lo[i], hi[i]]
+       (Lopez-Ortiz, Quimper, Tromp, van Beek 2003). Returns the
+       tightened lower bounds, or None if no assignment of distinct
+       values exists. The upper bounds are tightened by calling this
+       on the negated intervals.'''
+    n = len(lo)
+    minsorted = sorted(range(n), key=lambda i: lo[i])
+    maxsorted = sorted(range(n), key=lambda i: hi[i])
+    minrank = [0]*n
+    maxrank = [0]*n
+
+    #bounds holds the distinct values of lo[i] and hi[i]+1 in order
+    last = lo[minsorted[0]] - 2
+    bounds = [last]
+    i = j = 0
+    nxtmin = lo[minsorted[0]]
+    nxtmax = hi[maxsorted[0]] + 1
+    while True:
+        if i < n and nxtmin <= nxtmax:
+            if nxtmin != last:
+                last = nxtmin
+                bounds.append(last)
+            minrank[minsorted[i]] = len(bounds) - 1
+            i += 1
+            if i < n:
+                nxtmin = lo[minsorted[i]]
+        else:
+            if nxtmax != last:
+                last = nxtmax
+                bounds.append(last)
+            maxrank[maxsorted[j]] = len(bounds) - 1
+            j += 1
+            if j == n:
+                break
+            nxtmax = hi[maxsorted[j]] + 1
+    nb = len(bounds) - 1
+    bounds.append(bounds[nb] + 2)
+
+    t = [0]*(nb+2)     #tree links for the capacity intervals
+    d = [0]*(nb+2)     #free capacity of each interval
+    h = [0]*(nb+2)     #tree links for the Hall intervals
+    for k in range(1, nb+2):
+        t[k] = h[k] = k-1
+        d[k] = bounds[k] - bounds[k-1]
+
+    def pathmax(a, k):
+        while a[k] > k:
+            k = a[k]
+        return k
+
+    def pathset(a, start, end, to):
+        k = start
+        while k != end:
+            nxt = a[k]
+            a[k] = to
+            k = nxt
+
+    newlo = list(lo)
+    for var in maxsorted:
+        x = minrank[var]
+        y = maxrank[var]
+        z = pathmax(t, x+1)
+        j = t[z]
+        d[z] -= 1
+        if d[z] == 0:
+            t[z] = z+1
+            z = pathmax(t, t[z])
+            t[z] = j
+        pathset(t, x+1, z, z)
+        if d[z] < bounds[z] - bounds[y]:
+            return None
+        if h[x] > x:
+            w = pathmax(h, h[x])
+            newlo[var] = bounds[w]
+            pathset(h, x, w, w)
+        if d[z] == bounds[z] - bounds[y]:
+            pathset(h, h[y], j-1, y)
+            h[y] = j-1
+    return newlo
 
 
 def findvals(remainingVars, assignment, finalTestfn, partialTestfn=lambda x: True):
@@ -256,6 +1091,233 @@ def findvals_(remainingVars, assignment, finalTestfn, partialTestfn):
     return False
 
 
+class MDDTableConstraint(PropagatorConstraint):
+    '''Table constraint whose satisfying tuples are compiled into a
+       reduced multi-valued decision diagram (MDD).
+
+       Takes the same arguments as TableConstraint (a list of
+       satisfying assignments or a Table). The MDD has one layer per
+       scope variable, an edge labelled val from a node in layer i
+       means scope[i] = val, and every path from the root to the
+       terminal node is a satisfying tuple. Nodes with the same
+       outgoing edges are merged, so highly regular tuple sets
+       (e.g., sequences built from a follow relation) give diagrams
+       much smaller than the table. The tuples themselves are not
+       kept.
+
+       GAC is enforced by the MDD propagator: a node is dead if it
+       can't be reached from the root or can't reach the terminal
+       using edges whose values are in the current domains. A value
+       is supported iff it labels an edge between two live nodes.
+       Dead nodes are recorded on a trail together with the domains
+       they were found dead in, so deeper calls only look at the
+       remaining live nodes, and the deletions are undone when
+       search backtracks to domains that are not a subset of those.
+    '''
+
+    exactSupports = True
+
+    def __init__(self, name, scope, satisfyingAssignments):
+        PropagatorConstraint.__init__(self, name, scope)
+        self._name = "MDDTableCnstr_" + name
+        self._loadTable(satisfyingAssignments)
+
+    def setTable(self, satisfyingAssignments):
+        '''replace the satisfying assignments (a list or a Table, as
+           passed to __init__), recompiling the MDD'''
+        self._loadTable(satisfyingAssignments)
+
+    def _loadTable(self, satisfyingAssignments):
+        if isinstance(satisfyingAssignments, Table):
+            satisfyingAssignments = satisfyingAssignments.tuples()
+        self._compile(satisfyingAssignments)
+        self._resetPropagator()
+
+    def _resetPropagator(self):
+        '''forget the propagation state of the previous MDD, to be
+           called whenever the MDD is (re)built'''
+        self._dead = set()
+        self._trail = []       #stack of (domains, nodes found dead with those domains)
+        self._supported = None
+
+    def _compile(self, tuples):
+        '''Build the reduced MDD bottom up. Node 0 is the terminal,
+           self._out[node] is a dictionary mapping each edge value to
+           the child node, self._layers[i] is the list of nodes in
+           layer i.'''
+        arity = self.arity()
+        self._out = [dict()]
+        self._layers = [[] for i in range(arity)] + [[0]]
+        unique = dict()     #(layer, edges) --> node
+
+        def build(depth, suffixes):
+            if depth == arity:
+                return 0
+            groups = dict()
+            for t in suffixes:
+                if t[depth] in groups:
+                    groups[t[depth]].append(t)
+                else:
+                    groups[t[depth]] = [t]
+            edges = dict()
+            for val in groups:
+                edges[val] = build(depth+1, groups[val])
+            key = (depth, frozenset(edges.items()))
+            if key not in unique:
+                unique[key] = len(self._out)
+                self._out.append(edges)
+                self._layers[depth].append(unique[key])
+            return unique[key]
+
+        tuples = [tuple(t) for t in tuples]
+        if tuples:
+            self._root = build(0, tuples)
+        else:
+            #no satisfying tuples, an empty root node supports nothing
+            self._root = len(self._out)
+            self._out.append(dict())
+            self._layers[0].append(self._root)
+
+    def mddSize(self):
+        '''return the number of nodes and the number of edges in the MDD'''
+        return len(self._out), sum([len(e) for e in self._out])
+
+    def check(self):
+        '''check if current variable assignments are in the satisfying set'''
+        node = self._root
+        for v in self.scope():
+            if not v.isAssigned():
+                return True
+            node = self._out[node].get(v.getValue())
+            if node is None:
+                return False
+        return True
+
+    def filter(self, domains):
+        dead = self._dead
+        #undo deletions made for domains we have since backtracked out of
+        while self._trail:
+            tdoms, killed = self._trail[-1]
+            if all([domains[i] <= tdoms[i] for i in range(len(domains))]):
+                break
+            for node in killed:
+                dead.discard(node)
+            self._trail.pop()
+
+        killed = []
+        #backward pass: kill nodes that can no longer reach the terminal
+        for layer in range(self.arity()-1, -1, -1):
+            dom = domains[layer]
+            for node in self._layers[layer]:
+                if node in dead:
+                    continue
+                alive = False
+                for val, child in self._out[node].iteritems():
+                    if val in dom and child not in dead:
+                        alive = True
+                        break
+                if not alive:
+                    dead.add(node)
+                    killed.append(node)
+
+        #forward pass: collect supports, kill nodes unreachable from the root
+        supported = [set() for d in domains]
+        reached = set()
+        if self._root not in dead:
+            reached.add(self._root)
+        for layer in range(self.arity()):
+            dom = domains[layer]
+            nxt = set()
+            for node in self._layers[layer]:
+                if node in dead:
+                    continue
+                if node not in reached:
+                    dead.add(node)
+                    killed.append(node)
+                    continue
+                for val, child in self._out[node].iteritems():
+                    if val in dom and child not in dead:
+                        supported[layer].add(val)
+                        nxt.add(child)
+            reached = nxt
+
+        if killed:
+            self._trail.append((domains, killed))
+        return supported
+
+
+class RegularConstraint(MDDTableConstraint):
+    '''Regular constraint: the sequence of values of the scope variables
+       must be accepted by a deterministic finite automaton.
+
+       transitions is a dictionary mapping (state, value) to the next
+       state, start is the initial state and accepting is a list of
+       the accepting states. Missing transitions reject.
+
+       The automaton is unrolled over the scope into a layered graph
+       (one copy of the reachable states per position, edges for the
+       transitions on values in the variable's domain), keeping only
+       nodes that can still reach an accepting state at the end. The
+       layered graph is an MDD, so GAC is enforced by the incremental
+       MDD propagator inherited from MDDTableConstraint, in time
+       O(n*|states|*|values|) per pass.
+    '''
+
+    def __init__(self, name, scope, transitions, start, accepting):
+        MDDTableConstraint.__init__(self, name, scope, [])
+        self._name = "Regular_" + name
+        self._unroll(transitions, start, set(accepting))
+        self._resetPropagator()
+
+    def setTable(self, satisfyingAssignments):
+        '''not supported, the MDD comes from the automaton (build a new
+           RegularConstraint instead)'''
+        print "Error RegularConstraint {} has no table to set, its MDD comes from an automaton".format(self.name())
+
+    def _unroll(self, transitions, start, accepting):
+        arity = self.arity()
+        byState = dict()       #state --> [(value, next state)]
+        for (state, val) in transitions:
+            byState.setdefault(state, []).append((val, transitions[(state, val)]))
+
+        #forward: the states reachable at each layer
+        reach = [set([start])]
+        for i, var in enumerate(self._scope):
+            dom = set(var.domain())
+            nxt = set()
+            for state in reach[i]:
+                for (val, to) in byState.get(state, []):
+                    if val in dom:
+                        nxt.add(to)
+            reach.append(nxt)
+
+        #backward: build nodes for the states that can still accept.
+        #Node 0 is the terminal (all accepting states at the end).
+        self._out = [dict()]
+        self._layers = [[] for i in range(arity)] + [[0]]
+        node = dict([(state, 0) for state in reach[arity] if state in accepting])
+        for i in range(arity-1, -1, -1):
+            dom = set(self._scope[i].domain())
+            layer = dict()
+            for state in reach[i]:
+                edges = dict()
+                for (val, to) in byState.get(state, []):
+                    if val in dom and to in node:
+                        edges[val] = node[to]
+                if edges:
+                    layer[state] = len(self._out)
+                    self._out.append(edges)
+                    self._layers[i].append(layer[state])
+            node = layer
+        if start in node:
+            self._root = node[start]
+        else:
+            #the automaton accepts no sequence
+            self._root = len(self._out)
+            self._out.append(dict())
+            self._layers[0].append(self._root)
+
+
 class NValuesConstraint(Constraint):
     '''NValues constraint over a set of variables.
        Among the variables in the constraint's scope the number that
@@ -270,6 +1332,15 @@ class NValuesConstraint(Constraint):
        the V1, V2, V3, V4 are assigned the value 3 or 2, and at most 3
        of them have been assigned the value 3 or 2
 
+       GAC only needs two counts: 'must', the number of variables
+       whose current domain only has required values, and 'can', the
+       number of variables whose current domain has at least one
+       required value. var=val has a support iff the counts obtained by
+       forcing var=val satisfy must <= upper_bound and can >= lower_bound.
+       The counts are kept between calls and only the variables whose
+       current domain changed since the last call are reclassified
+       (see Variable.stamp), so each hasSupport is O(1) plus the work
+       of catching up with prunes and backtracks.
     '''
 
     #Question 5 you have to complete the implementation of
@@ -280,8 +1351,18 @@ class NValuesConstraint(Constraint):
         Constraint.__init__(self,name, scope)
         self._name = "NValues_" + name
         self._required = required_values
+        self._requiredSet = set(required_values)
         self._lb = lower_bound
         self._ub = upper_bound
+        self._position = dict()
+        for i, v in enumerate(self._scope):
+            self._position[v] = i
+        self._must = [0]*len(self._scope)     #1 if var i can only take required values
+        self._can = [0]*len(self._scope)      #1 if var i can take a required value
+        self._mustCount = 0
+        self._canCount = 0
+        self._stamps = [None]*len(self._scope)
+        self._clock = None
 
     def check(self):
         #Check if current variable assignments are in the satisfying set
@@ -299,93 +1380,457 @@ class NValuesConstraint(Constraint):
     def hasSupport(self, var, val):
         '''check if var=val has an extension to an assignment of the
            other variable in the constraint that satisfies the constraint
-
-           HINT: check the implementation of AllDiffConstraint.hasSupport
-                 a similar approach is applicable here (but of course
-                 there are other ways as well)
         '''
-        if var not in self.scope():
+        if var not in self._position:
             return True  #var=val has support on any constraint it does not participate in
-        
-        def satisfying_lb_ub(l):
-            sum = 0
-            for (variable, value) in l:
-                if value in self._required:
-                    sum += 1
-            return self._lb <= sum <= self._ub
-        
-        def satisfying_ub(l):
-            sum = 0
-            for (variable, value) in l:
-                if value in self._required:
-                    sum += 1
-            return sum <= self._ub
-
-        
-        varsToAssign = self.scope()
-        varsToAssign.remove(var)
-        x = findvals(varsToAssign, [(var, val)], satisfying_lb_ub, satisfying_ub)
-        return x
+        self._updateCounts()
+        i = self._position[var]
+        must = self._mustCount - self._must[i]
+        can = self._canCount - self._can[i]
+        if val in self._requiredSet:
+            must += 1
+            can += 1
+        return must <= self._ub and can >= self._lb
+
+    def _updateCounts(self):
+        '''reclassify the variables whose current domain has changed
+           since the counts were last updated'''
+        if self._clock == Variable.clock():
+            return
+        for i, v in enumerate(self._scope):
+            if v.stamp() != self._stamps[i]:
+                self._stamps[i] = v.stamp()
+                must = 1
+                can = 0
+                for val in v.curDomain():
+                    if val in self._requiredSet:
+                        can = 1
+                    else:
+                        must = 0
+                self._mustCount += must - self._must[i]
+                self._canCount += can - self._can[i]
+                self._must[i] = must
+                self._can[i] = can
+        self._clock = Variable.clock()
+
+class SequenceConstraint(PropagatorConstraint):
+    '''Sequence constraint over an ordered list of variables.
+       Every window of k consecutive variables in the scope has
+       between lb and ub variables assigned values in 'values'.
+       (Scopes shorter than k are unconstrained.)
+
+       This is equivalent to one NValuesConstraint(window, values, lb, ub)
+       per window, but all windows are propagated together so
+       reasoning across overlapping windows is not lost.
+
+       Only whether a variable takes a value in 'values' matters, so
+       let x_i be 1 if it does and 0 otherwise and S_i = x_1 + ... + x_i
+       (S_0 = 0). The constraint is the system of difference constraints
+          l_i <= S_i - S_{i-1} <= u_i  (the 0/1 options left in var i's domain)
+          lb <= S_{i+k} - S_i <= ub    (the windows)
+       which, as a graph with an edge u->v of weight w for each
+       S_v - S_u <= w, is satisfiable iff it has no negative cycle
+       (Bellman-Ford). x_i = 1 is then supported iff the shortest
+       path from S_{i-1} to S_i has length >= 1, and x_i = 0 iff the
+       shortest path from S_i to S_{i-1} has length >= 0. These paths
+       are found by Dijkstra on the reduced costs given by the
+       Bellman-Ford potentials. This gives GAC.
+    '''
 
-#Make sure all flights are assigned once
-class coverAllFlight(Constraint):
-    def __init__(self, name, scope, values):
-        Constraint.__init__(self,name, scope)
-        self._name = "coverAllFlight_" + name
-        self._scope = scope
-        self._values = values#values are all flights
+    exactSupports = True
 
-      
+    def __init__(self, name, scope, values, k, lb, ub):
+        PropagatorConstraint.__init__(self, name, scope)
+        self._name = "Sequence_" + name
+        self._values = set(values)
+        self._k = k
+        self._lb = lb
+        self._ub = ub
 
     def check(self):
-        flights = dict()
-        for var in self.scope():
-            if var.isAssigned():
-                flight = var.getValue()
-                if flight != 0:
-                    if flight in flights:
-                        flights[flight] += 1
-                    else:
-                        flights[flight] = 1
-            else:
+        ones = []
+        for v in self.scope():
+            if not v.isAssigned():
                 return True
-        if len(flights) < len(set(self._values)):#Not cover all flights
-            return False
-        for flight in flights:
-            if flights[flight] > 1:#Assign more than once
+            ones.append(1 if v.getValue() in self._values else 0)
+        for i in range(len(ones) - self._k + 1):
+            if not self._lb <= sum(ones[i:i+self._k]) <= self._ub:
                 return False
         return True
 
-    def hasSupport(self, var, val):
-        '''check if var=val has an extension to an assignment of the
-           other variable in the constraint that satisfies the constraint
-        '''
-        if var not in self.scope():
-            return True  #var=val has support on any constraint it does not participate in
-        
-        def cover_all_flights(l):
-            diff_flight = dict()
-            for (var, val) in l:
-                if val != 0:
-                    if val in diff_flight:
-                        diff_flight[val] += 1
-                    else:
-                        diff_flight[val] = 1
-            if len(diff_flight) < len(set(self._values)):
+    def filter(self, domains):
+        n = len(domains)
+        can1 = [bool(d & self._values) for d in domains]
+        can0 = [bool(d - self._values) for d in domains]
+        if not all([can1[i] or can0[i] for i in range(n)]):
+            return [set() for d in domains]
+
+        #node i is S_i
+        succ = [[] for i in range(n+1)]
+        for i in range(1, n+1):
+            succ[i-1].append((i, 1 if can1[i-1] else 0))
+            succ[i].append((i-1, 0 if can0[i-1] else -1))
+        for i in range(n - self._k + 1):
+            succ[i].append((i + self._k, self._ub))
+            succ[i + self._k].append((i, -self._lb))
+
+        #Bellman-Ford from a virtual source joined to every node by a 0 edge
+        pot = [0]*(n+1)
+        for rnd in range(n+2):
+            changed = False
+            for u in range(n+1):
+                for (v, w) in succ[u]:
+                    if pot[u] + w < pot[v]:
+                        pot[v] = pot[u] + w
+                        changed = True
+            if not changed:
+                break
+        if changed:
+            return [set() for d in domains]   #negative cycle, no solution
+
+        supported = []
+        for i in range(1, n+1):
+            sup = set()
+            if can1[i-1]:
+                d = self._distance(succ, pot, i-1, i)
+                if d is None or d >= 1:
+                    sup.update([val for val in domains[i-1] if val in self._values])
+            if can0[i-1]:
+                d = self._distance(succ, pot, i, i-1)
+                if d is None or d >= 0:
+                    sup.update([val for val in domains[i-1] if val not in self._values])
+            supported.append(sup)
+        return supported
+
+    def _distance(self, succ, pot, source, target):
+        '''shortest path length from source to target (Dijkstra on the
+           reduced costs w + pot[u] - pot[v] >= 0), None if there is no path'''
+        dist = {source: 0}
+        done = set()
+        pq = util.PriorityQueue()
+        pq.push(source, 0)
+        while not pq.isEmpty():
+            u = pq.pop()
+            if u in done:
+                continue
+            if u == target:
+                return dist[u] - pot[source] + pot[target]
+            done.add(u)
+            for (v, w) in succ[u]:
+                d = dist[u] + w + pot[u] - pot[v]
+                if v not in dist or d < dist[v]:
+                    dist[v] = d
+                    pq.push(v, d)
+        return None
+
+
+class GlobalCardinalityConstraint(PropagatorConstraint):
+    '''Global cardinality constraint over a set of variables.
+
+       bounds is a dictionary mapping values to pairs (lb, ub): the
+       number of variables in the scope assigned that value must be
+       in the range [lb, ub]. Values not in bounds can be taken by any
+       number of variables.
+
+       GAC is enforced with Regin's flow based algorithm. The
+       variables are assigned to values so that every value gets at
+       least lb variables (first pass, value capacities lb) and every
+       variable gets a value (second pass, capacities ub), by
+       augmenting paths. If that fails the constraint can't be
+       satisfied. Otherwise var=val, not in the assignment, has a
+       support iff var and val are in the same strongly connected
+       component of the residual graph, which has edges
+          var -> val  for val in var's domain not assigned to var
+          val -> var  for var assigned to val
+          val -> t    if val has fewer than ub variables
+          t -> val    if val has more than lb variables
+
+       The assignment is kept between calls and repaired: variables
+       whose value was pruned, and variables above their value's lb
+       in the first pass, are freed and re-augmented.'''
+
+    exactSupports = True
+
+    def __init__(self, name, scope, bounds):
+        PropagatorConstraint.__init__(self,name, scope)
+        self._name = "GCC_" + name
+        self._bounds = dict(bounds)
+        self._asg = [None]*len(self._scope)     #var index --> assigned value
+
+    def _lb(self, val):
+        if val in self._bounds:
+            return self._bounds[val][0]
+        return 0
+
+    def _ub(self, val):
+        if val in self._bounds:
+            return self._bounds[val][1]
+        return len(self._scope)
+
+    def check(self):
+        counts = dict()
+        for v in self.scope():
+            if not v.isAssigned():
+                return True
+            counts[v.getValue()] = counts.get(v.getValue(), 0) + 1
+        for val in self._bounds:
+            if not self._lb(val) <= counts.get(val, 0) <= self._ub(val):
                 return False
-            for key in diff_flight:
-                if diff_flight[key] > 1:#Assign more than once
-                    return False
+        return True
+
+    def filter(self, domains):
+        n = len(domains)
+        asg = self._asg
+        holders = dict()      #value --> var indicies with value in their domain
+        for i in range(n):
+            for val in domains[i]:
+                if val in holders:
+                    holders[val].append(i)
+                else:
+                    holders[val] = [i]
+        for val in self._bounds:
+            if self._bounds[val][0] > len(holders.get(val, [])):
+                return [set() for d in domains]
+
+        #first pass, capacities lb: keep at most lb of the previous
+        #assignment for each value and augment to fill the lbs.
+        owners = dict()       #value --> list of var indicies assigned to it
+        for i in range(n):
+            val = asg[i]
+            if val is not None and val in domains[i] and \
+               len(owners.get(val, [])) < self._lb(val):
+                owners.setdefault(val, []).append(i)
+            else:
+                asg[i] = None
+        for i in range(n):
+            if asg[i] is None:
+                self._augment(i, domains, asg, owners, self._lb)
+        for val in self._bounds:
+            if len(owners.get(val, [])) < self._lb(val):
+                return [set() for d in domains]
+        #second pass, capacities ub: every variable must get a value
+        for i in range(n):
+            if asg[i] is None and not self._augment(i, domains, asg, owners, self._ub):
+                return [set() for d in domains]
+
+        #residual graph. Nodes 0..n-1 are the variables, then the values, then t
+        vals = list(holders.keys())
+        node = dict()
+        for k, val in enumerate(vals):
+            node[val] = n + k
+        t = n + len(vals)
+        succ = [[] for k in range(t+1)]
+        for i in range(n):
+            for val in domains[i]:
+                if val != asg[i]:
+                    succ[i].append(node[val])
+        for val in vals:
+            load = len(owners.get(val, []))
+            succ[node[val]].extend(owners.get(val, []))
+            if load < self._ub(val):
+                succ[node[val]].append(t)
+            if load > self._lb(val):
+                succ[t].append(node[val])
+        comp = _stronglyConnected(succ)
+
+        supported = []
+        for i in range(n):
+            sup = set()
+            for val in domains[i]:
+                if val == asg[i] or comp[node[val]] == comp[i]:
+                    sup.add(val)
+            supported.append(sup)
+        return supported
+
+    def _augment(self, i, domains, asg, owners, cap):
+        '''find an alternating path from the unassigned variable i to a
+           value with load below cap(value) (breadth first), and flip
+           it. Return False if there is none'''
+        parent = dict()       #value --> var index that reached it
+        queue = [i]
+        for x in queue:
+            for val in domains[x]:
+                if val in parent:
+                    continue
+                parent[val] = x
+                if len(owners.get(val, [])) < cap(val):
+                    #flip the path back to i
+                    while True:
+                        x = parent[val]
+                        prev = asg[x]
+                        asg[x] = val
+                        owners.setdefault(val, []).append(x)
+                        if prev is not None:
+                            owners[prev].remove(x)
+                        if x == i:
+                            return True
+                        val = prev
+                for y in owners.get(val, []):
+                    queue.append(y)
+        return False
+
+
+class NoCycleConstraint(PropagatorConstraint):
+    '''The successor variables of a set of nodes form disjoint paths.
+
+       succ[i] is the successor variable of node i and nodes[i] the
+       value standing for node i in the domains of the successor
+       variables. Any other value (e.g., the end of a path) has no
+       successor. The constraint holds if no node is the successor of
+       two nodes and the successors form no cycle, i.e., this
+       eliminates subtours in successor models. (An AllDiffConstraint
+       on the successor variables prunes the shared successors much
+       more strongly, but isn't needed for correctness.)
+
+       The filtering follows the chains of successor variables with
+       a single value: a node can't be the successor of a second
+       node, and the tail of the chain starting at node a can't have
+       a as its successor. Two fixed successors pointing to the same
+       node, or a chain with no start (it closes a cycle), leave no
+       supports.'''
+
+    def __init__(self, name, succ, nodes):
+        PropagatorConstraint.__init__(self, name, succ)
+        self._name = "NoCycle_" + name
+        self._nodes = list(nodes)
+        self._index = dict()
+        for i, node in enumerate(nodes):
+            self._index[node] = i
+
+    def _chains(self, domains):
+        #return (next, heads): the fixed successor index of each node
+        #(None if not fixed or not a node) and the nodes no fixed
+        #successor points to, or None if two fixed successors point to
+        #the same node or the chains from the heads miss a node (it is
+        #on a cycle)
+        nxt = [None] * len(domains)
+        pointed = set()
+        for i, d in enumerate(domains):
+            if len(d) == 1:
+                for val in d:
+                    j = self._index.get(val)
+                    if j is not None:
+                        if j in pointed:
+                            return None
+                        nxt[i] = j
+                        pointed.add(j)
+        heads = [i for i in range(len(domains)) if i not in pointed]
+        seen = set()
+        for i in heads:
+            walk = set()
+            while i is not None:
+                if i in walk:
+                    return None
+                walk.add(i)
+                i = nxt[i]
+            seen.update(walk)
+        if len(seen) < len(domains):
+            return None
+        return nxt, heads
+
+    def check(self):
+        domains = [set(v.curDomain()) if v.isAssigned() else set() for v in self._scope]
+        return self._chains(domains) is not None
+
+    def filter(self, domains):
+        chains = self._chains(domains)
+        if chains is None:
+            return [set() for d in domains]
+        nxt, heads = chains
+        supported = [set(d) for d in domains]
+        #nodes with a fixed predecessor can't be the successor of another node
+        taken = set([self._nodes[j] for j in nxt if j is not None])
+        for i, d in enumerate(supported):
+            if nxt[i] is None:
+                d -= taken
+        for head in heads:
+            i = head
+            while nxt[i] is not None:
+                i = nxt[i]
+            supported[i].discard(self._nodes[head])
+        if not all(supported):
+            return [set() for d in domains]
+        return supported
+
+class SuccessorConstraint(PropagatorConstraint):
+    '''Links the label of a node to the label of its successor in a
+       successor model (e.g., the vehicle or the load of the node).
+
+       succ is the successor variable of the node and label its
+       label variable. targets maps values of succ to pairs (var,
+       relation): if succ takes that value, relation(label value,
+       var value) must hold, or relation(label value) if var is None
+       (e.g., the value is the end of a path). Values of succ not in
+       targets are not restricted.'''
+
+    def __init__(self, name, succ, label, targets):
+        scope = [succ, label]
+        for val, (var, relation) in targets.items():
+            if var is not None and var not in scope:
+                scope.append(var)
+        PropagatorConstraint.__init__(self, name, scope)
+        self._name = "Successor_" + name
+        self._targets = dict()
+        for val, (var, relation) in targets.items():
+            self._targets[val] = (self._position.get(var), relation)
+
+    def check(self):
+        succ, label = self._scope[0], self._scope[1]
+        if not succ.isAssigned() or not label.isAssigned():
+            return True
+        if succ.getValue() not in self._targets:
             return True
+        pos, relation = self._targets[succ.getValue()]
+        if pos is None:
+            return relation(label.getValue())
+        if not self._scope[pos].isAssigned():
+            return True
+        return relation(label.getValue(), self._scope[pos].getValue())
+
+    def filter(self, domains):
+        supported = [set() for d in domains]
+        free = set()    #target positions some supported succ value leaves unrestricted
+        targets = range(2, len(domains))
+        for val in domains[0]:
+            if val not in self._targets:
+                supported[0].add(val)
+                supported[1].update(domains[1])
+                free.update(targets)
+                continue
+            pos, relation = self._targets[val]
+            for a in domains[1]:
+                if pos is None:
+                    if relation(a):
+                        supported[0].add(val)
+                        supported[1].add(a)
+                    continue
+                for b in domains[pos]:
+                    if relation(a, b):
+                        supported[0].add(val)
+                        supported[1].add(a)
+                        supported[pos].add(b)
+            if val in supported[0]:
+                free.update([k for k in targets if k != pos])
+        if not supported[0]:
+            return [set() for d in domains]
+        for k in free:
+            supported[k] = set(domains[k])
+        return supported
 
-        def could_cover_all(l):
-            return len(set(self._scope)) >= len(set(self._values)) 
+#Make sure all flights are assigned once
+class coverAllFlight(GlobalCardinalityConstraint):
+    '''Every flight in values is assigned to exactly one of the
+       variables in the scope, the other values (i.e., 0, no flight)
+       can be used any number of times. A global cardinality
+       constraint with bounds (1, 1) for every flight.'''
+    def __init__(self, name, scope, values):
+        bounds = dict()
+        for flight in values:
+            bounds[flight] = (1, 1)
+        GlobalCardinalityConstraint.__init__(self, name, scope, bounds)
+        self._name = "coverAllFlight_" + name
+        self._values = values#values are all flights
 
-        
-        varsToAssign = self.scope()
-        varsToAssign.remove(var)
-        x = findvals(varsToAssign, [(var, val)], cover_all_flights, could_cover_all)
-        return x
 """
 #New constraints for Q6: 
 #Check whether the initial flight is valid
@@ -18,6 +18,8 @@ class Variable:
 
     undoDict = dict()             #stores pruned values indexed by a
                                         #(variable,value) reason pair
+    _clock = 0                    #global counter used to stamp changes
+                                  #to the current domains/values
     def __init__(self, name, domain):
         '''Create a variable object, specifying its name (a
         string) and domain of values.
@@ -25,7 +27,11 @@ class Variable:
         self._name = name                #text name for variable
         self._dom = list(domain)         #Make a copy of passed domain
         self._curdom = list(domain)      #using list
+        self._curset = None              #same values, for O(1) membership tests
+                                         #(built when first needed)
         self._value = None
+        self._stamp = 0
+        self._touch()
 
     def __str__(self):
         return "Variable {}".format(self._name)
@@ -41,6 +47,23 @@ class Variable:
     def resetDomain(self, newdomain):
         '''reset the domain of this variable'''
         self._dom = newdomain
+        self._touch()
+
+    def _touch(self):
+        Variable._clock += 1
+        self._stamp = Variable._clock
+
+    def stamp(self):
+        '''return a number that changes every time the current domain
+           or the value of this variable changes. Constraints
+           can use it to decide if cached propagation work is still
+           valid.'''
+        return self._stamp
+
+    @staticmethod
+    def clock():
+        '''return the stamp of the most recent change to any variable'''
+        return Variable._clock
 
     def getValue(self):
         return self._value
@@ -50,6 +73,7 @@ class Variable:
             print "Error: tried to assign value {} to variable {} that is not in {}'s domain".format(value,self._name,self._name)
         else:
             self._value = value
+            self._touch()
 
     def unAssign(self):
         self.setValue(None)
@@ -67,6 +91,17 @@ class Variable:
             return([self.getValue()])
         return(list(self._curdom))
 
+    def _currentSet(self):
+        if self._curset is None:
+            self._curset = set(self._curdom)
+        return self._curset
+
+    def curBounds(self):
+        '''Return (min, max) of the current domain'''
+        if self.isAssigned():
+            return self.getValue(), self.getValue()
+        return min(self._curdom), max(self._curdom)
+
     def curDomainSize(self):
         '''Return the size of the current domain'''
         if self.isAssigned():
@@ -77,14 +112,16 @@ class Variable:
         '''check if value is in current domain'''
         if self.isAssigned():
             return(value==self.getValue())
-        return(value in self._curdom)
+        return(value in self._currentSet())
 
     def pruneValue(self, value, reasonVar, reasonVal):
         '''Remove value from current domain'''
         try:
+            self._currentSet().remove(value)
             self._curdom.remove(value)
-        except:
+        except (KeyError, ValueError):
             print "Error: tried to prune value {} from variable {}'s domain, but value not present!".format(value, self._name)
+        self._touch()
         dkey = (reasonVar, reasonVal)
         if not dkey in Variable.undoDict:
             Variable.undoDict[dkey] = []
@@ -92,9 +129,14 @@ class Variable:
 
     def restoreVal(self, value):
         self._curdom.append(value)
+        if self._curset is not None:
+            self._curset.add(value)
+        self._touch()
 
     def restoreCurDomain(self):
         self._curdom = self.domain()
+        self._curset = None
+        self._touch()
 
     def reset(self):
         self.restoreCurDomain()
@@ -105,7 +147,7 @@ class Variable:
 
     @staticmethod
     def clearUndoDict():
-        undoDict = dict()
+        Variable.undoDict = dict()
 
     @staticmethod
     def restoreValues(reasonVar, reasonVal):
@@ -134,6 +176,13 @@ class Constraint:
        the constraint greaterThan(V1,V2) is not the same as the
        contraint greaterThan(V2,V1).
     '''
+
+    #GAC only rechecks a constraint after pruning one of its variables
+    #if that variable has at most recheckSize values left. Constraints
+    #that support every value of a variable as long as the others have
+    #more than k values each set this to k.
+    recheckSize = sys.maxint
+
     def __init__(self, name, scope):
         '''create a constraint object, specify the constraint name (a
         string) and its scope (an ORDERED list of variable
@@ -141,6 +190,14 @@ class Constraint:
         self._scope = list(scope)
         self._name = "baseClass_" + name  #override in subconstraint types!
 
+    def signature(self):
+        '''return a hashable key of the relation the constraint imposes
+           on its (ordered) scope: constraints with equal keys are
+           satisfied by the same tuples of values. By default the
+           constraint itself, subclasses defined by a few parameters
+           return those (see cspComponents in backtracking.py).'''
+        return self
+
     def scope(self):
         return list(self._scope)
 
@@ -161,6 +218,18 @@ class Constraint:
     def check(self):
         util.raiseNotDefined()
 
+    def violations(self, var, val):
+        '''return the number of violations of the constraint involving
+           var if var=val and the other variables keep their current
+           values (0 if none). Used by local search. By default it is 1
+           if the constraint is falsified, constraints that can count
+           their violations (or tell faster) override this.'''
+        old = var.getValue()
+        var.setValue(val)
+        ok = self.check()
+        var.setValue(old)
+        return 0 if ok else 1
+
     def name(self):
         return self._name
 
@@ -188,19 +257,27 @@ class CSP:
         #some sanity checks
         varsInCnst = set()
         for c in constraints:
-            varsInCnst = varsInCnst.union(c.scope())
+            varsInCnst.update(c._scope)
         for v in variables:
             if v not in varsInCnst:
                 print "Warning: variable {} is not in any constraint of the CSP {}".format(v.name(), self.name())
+        varSet = set(variables)
         for v in varsInCnst:
-            if v not in variables:
+            if v not in varSet:
                 print "Error: variable {} appears in constraint but specified as one of the variables of the CSP {}".format(v.name(), self.name())
 
+        self._varIndex = dict()
+        for i, v in enumerate(variables):
+            self._varIndex[v] = i
         self.constraints_of = [[] for i in range(len(variables))]
         for c in constraints:
             for v in c.scope():
-                i = variables.index(v)
+                i = self._varIndex[v]
                 self.constraints_of[i].append(c)
+        self._recheckSizes = [max([c.recheckSize for c in cs] or [0])
+                              for cs in self.constraints_of]
+        self._paramVars = []
+        self._paramCnstrs = []
 
     def name(self):
         return self._name
@@ -214,11 +291,56 @@ class CSP:
     def constraintsOf(self, var):
         '''return constraints with var in their scope'''
         try:
-            i = self.variables().index(var)
+            i = self._varIndex[var]
             return list(self.constraints_of[i])
-        except:
+        except KeyError:
             print "Error: tried to find constraint of variable {} that isn't in this CSP {}".format(var, self.name())
 
+    def recheckSize(self, var):
+        '''return the largest recheckSize of the constraints of var:
+           pruning var down to more values than this can't make any of
+           them lose supports'''
+        return self._recheckSizes[self._varIndex[var]]
+
+    def setParameters(self, variables=None, constraints=None):
+        '''Use the CSP as a template for a family of instances that
+           only differ in the domains of variables and in the
+           satisfying assignments of constraints (which must have a
+           setTable method, e.g., TableConstraint). Each instance is
+           then set up with bind, reusing the variables, constraints,
+           constraint index and tables of the CSP. See also
+           compileTemplate in backtracking.py.'''
+        self._paramVars = list(variables or [])
+        self._paramCnstrs = list(constraints or [])
+
+    def parameters(self):
+        '''return the parameter variables and constraints (see setParameters)'''
+        return list(self._paramVars), list(self._paramCnstrs)
+
+    def bind(self, domains=None, tables=None):
+        '''Set the CSP to an instance of the template: domains maps
+           parameter variables to their new domain and tables maps
+           parameter constraints to their new satisfying assignments
+           (parameters not given keep their last values). All the
+           variables are unassigned with their current domains
+           restored, ready for a new search.'''
+        if domains is None:
+            domains = dict()
+        if tables is None:
+            tables = dict()
+        for var, dom in domains.items():
+            if var not in self._paramVars:
+                print "Error: variable {} is not a parameter of the CSP {}".format(var.name(), self.name())
+                continue
+            var.resetDomain(list(dom))
+        for c, tuples in tables.items():
+            if c not in self._paramCnstrs:
+                print "Error: constraint {} is not a parameter of the CSP {}".format(c.name(), self.name())
+                continue
+            c.setTable(tuples)
+        for v in self._variables:
+            v.reset()
+
     def unAssignAllVars(self):
         '''unassign all variables'''
         for v in self.variables():
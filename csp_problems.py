@@ -1,15 +1,26 @@
 from csp import Constraint, Variable, CSP
 from constraints import *
-from backtracking import bt_search
+from backtracking import bt_search, SolutionProduct, countSolutions
+from exact_cover import sudokuSolutions
+from sudoku_engine import bitSolutions, bitSolve, cellVariables
 import util
+import collections
+import multiprocessing
+import random
+import sys
+import time
 
 
 ##################################################################
 ### NQUEENS
 ##################################################################
 
-def nQueens(n, tableCnstr):
-    '''Return an n-queens CSP, optionally use tableContraints'''
+def nQueens(n, tableCnstr, globalCnstr=None):
+    '''Return an n-queens CSP, optionally use tableContraints.
+       globalCnstr 'fc' or 'gac' replaces the constraints between
+       each pair of rows by a single NQueensConstraint doing that
+       level of filtering (needed for large n, there are n(n-1)/2
+       pairs of rows).'''
     i = 0
     dom = []
     for i in range(n):
@@ -19,6 +30,10 @@ def nQueens(n, tableCnstr):
     for i in dom:
         vars.append(Variable('Q{}'.format(i), dom))
 
+    if globalCnstr:
+        return CSP("{}-Queens".format(n), vars,
+                   [NQueensConstraint("Q1..Q{}".format(n), vars, globalCnstr)])
+
     cons = []
     for qi in range(len(dom)):
         for qj in range(qi+1, len(dom)):
@@ -32,7 +47,106 @@ def nQueens(n, tableCnstr):
     csp = CSP("{}-Queens".format(n), vars, cons)
     return csp
 
-def solve_nQueens(n, algo, allsolns, tableCnstr=False, variableHeuristic='fixed', trace=False):
+def nQueensAllDiff(n, consistency='gac'):
+    '''Return an n-queens CSP using three alldiff constraints (over
+       the columns, the columns + row and the columns - row) instead
+       of one constraint per pair of rows. consistency is passed to
+       the AllDiffConstraints ('gac' or 'bounds').'''
+    dom = range(1, n+1)
+    vars = [Variable('Q{}'.format(i), dom) for i in dom]
+    cons = [AllDiffConstraint("columns", vars, consistency),
+            AllDiffConstraint("diagonals", vars, consistency, [i for i in dom]),
+            AllDiffConstraint("anti-diagonals", vars, consistency, [-i for i in dom])]
+    return CSP("{}-Queens".format(n), vars, cons)
+
+def nQueensCount(n, processes=1):
+    '''Count the solutions of n-queens without building a CSP. The
+       columns and the two kinds of diagonals attacked by the queens
+       placed so far are kept as bitmasks, so the free columns of the
+       next row are one AND-NOT.
+
+       Only the solutions with the first queen in the left half of
+       the board are searched (with the first queen in the middle
+       column of an odd board, only those with the second queen in
+       the left half) and counted twice, as mirroring the board
+       gives the others. With processes > 1 the placements of the
+       first two queens are split among that many worker processes.'''
+    tasks = _nQueensTasks(n)
+    if processes > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(processes)
+        try:
+            counts = pool.map(_nQueensCountTask, tasks, 1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        counts = map(_nQueensCountTask, tasks)
+    return sum(counts)
+
+def _nQueensTasks(n):
+    #(n, weight, cols, diags, antis) with the first two queens placed
+    if n <= 1:
+        return [(n, 1, (1 << n) - 1, 0, 0)]
+    full = (1 << n) - 1
+    mid = n // 2
+    tasks = []
+    for c in range((n + 1) // 2):
+        bit = 1 << c
+        for c2 in range(n):
+            bit2 = 1 << c2
+            if abs(c - c2) <= 1 or (n % 2 and c == mid and c2 > mid):
+                continue
+            tasks.append((n, 2, bit | bit2, (((bit << 1) | bit2) << 1) & full,
+                          ((bit >> 1) | bit2) >> 1))
+    return tasks
+
+def _nQueensCountTask(task):
+    n, weight, cols, diags, antis = task
+    full = (1 << n) - 1
+
+    def count(cols, diags, antis):
+        if cols == full:
+            return 1
+        free = full & ~(cols | diags | antis)
+        found = 0
+        while free:
+            bit = free & -free
+            free ^= bit
+            found += count(cols | bit, ((diags | bit) << 1) & full, (antis | bit) >> 1)
+        return found
+
+    return weight * count(cols, diags, antis)
+
+def nQueensSolutions(n, vars=None):
+    '''Generate the solutions of n-queens with the bitmask search of
+       nQueensCount. Each solution is a list of (var, value) pairs, as
+       returned by bt_search, over the variables Q1...Qn (built if vars
+       is not given).'''
+    if vars is None:
+        vars = [Variable('Q{}'.format(i), range(1, n+1)) for i in range(1, n+1)]
+    if n == 0:
+        yield []
+        return
+    full = (1 << n) - 1
+    placed = []
+    #one entry per row: (the columns still to try, cols, diags, antis)
+    stack = [(full, 0, 0, 0)]
+    while stack:
+        free, cols, diags, antis = stack.pop()
+        del placed[len(stack):]   #the queens of this row and below
+        if not free:
+            continue
+        bit = free & -free
+        stack.append((free ^ bit, cols, diags, antis))
+        placed.append(bit)
+        if len(placed) == n:
+            yield [(vars[r], placed[r].bit_length()) for r in range(n)]
+            continue
+        cols, diags, antis = cols | bit, ((diags | bit) << 1) & full, (antis | bit) >> 1
+        stack.append((full & ~(cols | diags | antis), cols, diags, antis))
+
+def solve_nQueens(n, algo, allsolns, tableCnstr=False, variableHeuristic='fixed', trace=False, globalCnstr=None,
+                  countOnly=False, processes=1):
     '''Create and solve an nQueens CSP problem. The first
        parameer is 'n' the number of queens in the problem,
        The second specifies the search algorithm to use (one
@@ -42,21 +156,54 @@ def solve_nQueens(n, algo, allsolns, tableCnstr=False, variableHeuristic='fixed'
        'random' at random, 'fixed' in a fixed order, 'mrv'
        minimum remaining values. Finally 'trace' if specified to be
        'True' will generate some output as the search progresses.
+       globalCnstr is passed to nQueens.
+
+       algo 'BITS' uses the bitmask search of nQueensCount and
+       nQueensSolutions instead of a CSP, printing the solutions as
+       they are found. countOnly only prints the number of solutions
+       (with 'BITS' and allsolns they are not generated at all, and
+       the count uses that many processes). Returns the number of
+       solutions found.
     '''
-    csp = nQueens(n, tableCnstr)
+    if algo == 'BITS':
+        if countOnly and allsolns:
+            count = nQueensCount(n, processes)
+        else:
+            count = 0
+            for s in nQueensSolutions(n):
+                count += 1
+                if not countOnly:
+                    if count == 1:
+                        print "Solutions to {}-Queens:".format(n)
+                    _printQueensSolution(count, s)
+                if not allsolns:
+                    break
+        if count == 0:
+            print "No solutions to {}-Queens found".format(n)
+        elif countOnly:
+            print "{} solutions to {}-Queens".format(count, n)
+        return count
+
+    csp = nQueens(n, tableCnstr, globalCnstr)
     solutions, num_nodes = bt_search(algo, csp, variableHeuristic, allsolns, trace)
     print "Explored {} nodes".format(num_nodes)
     if len(solutions) == 0:
         print "No solutions to {} found".format(csp.name())
+    elif countOnly:
+        print "{} solutions to {}".format(len(solutions), csp.name())
     else:
        print "Solutions to {}:".format(csp.name())
        i = 0
        for s in solutions:
            i += 1
-           print "Solution #{}: ".format(i),
-           for (var,val) in s:
-               print "{} = {}, ".format(var.name(),val),
-           print ""
+           _printQueensSolution(i, s)
+    return len(solutions)
+
+def _printQueensSolution(i, s):
+    print "Solution #{}: ".format(i),
+    for (var,val) in s:
+        print "{} = {}, ".format(var.name(),val),
+    print ""
 
 ##################################################################
 ### SUDOKU
@@ -97,14 +244,19 @@ def sudokuCSP(initial_sudoku_board, model='neq'):
        binary not equals if model='neq' or using allDiff constraints
        if model='alldiff'
 
+       Larger boards of N lists of N for N = n*n (e.g., 16x16 boards
+       with 4x4 sub-squares) are handled in the same way, with values
+       1--N.
+
        The CSP contains a variable for each cell of the board with
-       with domain equal to {1-9} if the board has a 0 at that position,
+       with domain equal to {1-N} if the board has a 0 at that position,
        and domain equal {i} if the board has a fixed number i at that
        cell.
 
        The CSP has a neq constraint between every relevant pair of
-       varibles, or an alldiff constraint between every set of
-       variables in a row, column, or sub-square
+       varibles (once for pairs in the same row and sub-square), or
+       an alldiff constraint between every set of variables in a row,
+       column, or sub-square
 
     '''
     #your implementation for Question 4 changes this function
@@ -114,55 +266,62 @@ def sudokuCSP(initial_sudoku_board, model='neq'):
         print "Error wrong sudoku model specified {}. Must be one of {}".format(
             model, ['neq', 'alldiff'])
 
-    #first define the variables
-    i = 0
-    var_array = []
-    for row_list in initial_sudoku_board:
-        var_array.append([])
-        j = 0
-        for col in row_list:
+    N = len(initial_sudoku_board)
+    n = int(round(N ** 0.5))
+    if n * n != N:
+        print "Error sudoku board has {} rows, must be a square number".format(N)
+
+    #first define the variables, cell (i, j) is vars[N*i + j]
+    vars = []
+    for i in range(N):
+        for j in range(N):
             cell = initial_sudoku_board[i][j]
             if cell == 0:
-                dom = [1, 2, 3, 4, 5, 6, 7, 8, 9]
+                dom = range(1, N + 1)
             else:
                 dom = [cell]
-            var = Variable("V{},{}".format(i+1, j+1), dom)
-            var_array[i].append(var)
-            j += 1
-        i += 1
+            vars.append(Variable("V{},{}".format(i+1, j+1), dom))
 
     #Set up the constraints
-    #row constraints
+    units = sudokuUnits(n)
     constraint_list = []
+    if model == 'neq':
+        pairs = set()
+        for unit in units:
+            for a in unit:
+                for b in unit:
+                    if a < b:
+                        pairs.add((a, b))
+        for (a, b) in sorted(pairs):
+            constraint_list.append(NeqConstraint("({},{})".format(vars[a].name(), vars[b].name()),
+                                                 [vars[a], vars[b]]))
+    elif model == 'alldiff':
+        for k, unit in enumerate(units):
+            scope = [vars[c] for c in unit]
+            if k < N:
+                name = "[{}] row alldiff".format(k + 1)
+            elif k < 2*N:
+                name = "[{}] column alldiff".format(k - N + 1)
+            else:
+                #initial upper left hand index of subsquare
+                name = "[{},{}] square alldiff".format(unit[0] // N, unit[0] % N)
+            constraint_list.append(AllDiffConstraint(name, scope))
 
-    for row in var_array:
-        if model == 'neq':
-            constraint_list.extend(post_all_pairs(row))
-        elif model == 'alldiff':
-            constraint_list.extend([AllDiffConstraint("[{}] row alldiff".format(row), row)])
-
-    for colj in range(len(var_array[0])):
-        scope = map(lambda row: row[colj], var_array)
-        if model == 'neq':
-            constraint_list.extend(post_all_pairs(scope))
-        elif model == 'alldiff':
-            constraint_list.extend([AllDiffConstraint("[{}] column alldiff".format(colj), scope)])
-
-    for i in [0, 3, 6]:
-        for j in [0, 3, 6]:
-            #initial upper left hand index of subsquare
-            scope = []
-            for k in [0, 1, 2]:
-                for l in [0,1,2]:
-                    scope.append(var_array[i+k][j+l])
-            if model == 'neq':
-                constraint_list.extend(post_all_pairs(scope))
-            elif model == 'alldiff':
-                constraint_list.extend([AllDiffConstraint("[{},{}] square alldiff".format(i, j), scope)])
-
-    vars = [var for row in var_array for var in row]
     return CSP("Sudoku", vars, constraint_list)
 
+def sudokuUnits(n):
+    '''Return the rows, columns and sub-squares (in that order) of the
+       N x N sudoku board with n x n sub-squares (N = n*n), each a list
+       of the indices N*i + j of its cells (i, j)'''
+    N = n * n
+    rows = [range(N*i, N*i + N) for i in range(N)]
+    columns = [range(j, N*N, N) for j in range(N)]
+    squares = []
+    for i in range(0, N, n):
+        for j in range(0, N, n):
+            squares.append([N*(i + k) + j + l for k in range(n) for l in range(n)])
+    return rows + columns + squares
+
 def post_all_pairs(var_list):
     '''create a not equal constraint between all pairs of variables in var_list
        return list of constructed constraint objects'''
@@ -173,11 +332,68 @@ def post_all_pairs(var_list):
             constraints.append(c)
     return constraints
 
+class SudokuTemplate:
+    '''The CSP of sudokuCSP for any N x N board (n x n sub-squares),
+       built once for solving many boards. load(board) sets the
+       domains of the variables to those of the board (and unassigns
+       them), so the variables, constraints and the constraint index
+       of the CSP are reused from board to board.'''
+
+    def __init__(self, n=3, model='neq'):
+        N = n * n
+        self._N = N
+        self._full = range(1, N + 1)
+        self._csp = sudokuCSP([[0] * N for i in range(N)], model)
+        self._vars = self._csp.variables()   #cell (i, j) is _vars[N*i + j]
+
+    def csp(self):
+        return self._csp
+
+    def variables(self):
+        '''the cell variables in row order'''
+        return list(self._vars)
+
+    def load(self, board):
+        '''Set the CSP to board (in the format of sudokuCSP) and return it'''
+        N = self._N
+        vars = self._vars
+        for i in range(N):
+            row = board[i]
+            for j in range(N):
+                var = vars[N*i + j]
+                if row[j] == 0:
+                    var.resetDomain(self._full)
+                else:
+                    var.resetDomain([row[j]])
+                var.reset()
+        return self._csp
+
 def solve_sudoku(initialBoard, model, algo, allsolns,
                  variableHeuristic='fixed', trace=False):
     if not model in ['neq', 'alldiff']:
         print "Error wrong sudoku model specified {}. Must be one of {}".format(
             model, ['neq', 'alldiff'])
+    if algo in ['DLX', 'BITS']:
+        #dancing links exact cover or the bitmask engine, print the
+        #solutions as they are found
+        if len(initialBoard) != 9:
+            print "Error algorithm {} only solves 9x9 boards".format(algo)
+            return
+        if algo == 'DLX':
+            search = sudokuSolutions(initialBoard)
+        else:
+            search = bitSolutions(initialBoard)
+        i = 0
+        for s in search:
+            i += 1
+            print "Solution #{}: ".format(i)
+            sudoku_print_soln(s)
+            if not allsolns:
+                break
+        if i == 0:
+            print "No solutions to Sudoku found"
+        return
+
     csp = sudokuCSP(initialBoard, model)
 
     solutions, num_nodes = bt_search(algo, csp, variableHeuristic, allsolns, trace)
@@ -194,15 +410,152 @@ def solve_sudoku(initialBoard, model, algo, allsolns,
 def sudoku_print_soln(s):
     '''s is a list of (var,value) pairs. Organize them into
        the right order and then print it in a board layout'''
-    s.sort(key=lambda varval_pair: varval_pair[0].name())
-    print "-"*37
-    for i in range(0,9):
+    s.sort(key=lambda varval_pair: map(int, varval_pair[0].name()[1:].split(',')))
+    N = int(round(len(s) ** 0.5))
+    width = len(str(N))
+    print "-"*((width + 3)*N + 1)
+    for i in range(0,N):
         print "|",
-        for j in range(0,9):
-            indx = i*9 + j
-            print s[indx][1], "|",
+        for j in range(0,N):
+            indx = i*N + j
+            print str(s[indx][1]).rjust(width), "|",
         print ""
-        print "-"*37
+        print "-"*((width + 3)*N + 1)
+
+def sudoku_parse(line):
+    '''Return the board (in the format of sudokuCSP) of a line of 81
+       characters giving the cells row by row, with 0 or . for an
+       empty cell, or None if the line is not a board. Anything after
+       the board (separated by blanks) is ignored.'''
+    fields = line.split()
+    if not fields:
+        return None
+    line = fields[0]
+    if len(line) != 81:
+        return None
+    try:
+        cells = [0 if ch == '.' else int(ch) for ch in line]
+    except ValueError:
+        return None
+    return [cells[9*i:9*i + 9] for i in range(9)]
+
+def solve_sudoku_batch(infile, outfile, algo='BITS', model='alldiff',
+                       variableHeuristic='mrv', processes=1, chunksize=100):
+    '''Solve every board read from infile (a file object with one
+       board per line, see sudoku_parse) and write to outfile a line
+       for each, in the same order: the 81 digits of its first
+       solution, "No solution" or "Invalid board". algo is one of
+       BITS (default), DLX or a bt_search algorithm (with model and
+       variableHeuristic).
+
+       The boards are solved in chunks of chunksize. With processes >
+       1 the chunks are solved by that many worker processes, keeping
+       at most two chunks per worker in flight, so memory stays
+       bounded however many boards are read. Each worker creates the
+       81 cell variables (or the SudokuTemplate of model) once.
+
+       Prints the boards/sec and the median and 99th percentile time
+       per board (of a sample of 10000 boards) to stderr and returns
+       the number of boards.'''
+    stats = {'boards': 0}
+    sample = []
+    rng = random.Random(0)
+
+    def write(results):
+        for (line, secs) in results:
+            outfile.write(line + "\n")
+            stats['boards'] += 1
+            #reservoir sample of the times
+            if len(sample) < 10000:
+                sample.append(secs)
+            else:
+                k = rng.randrange(stats['boards'])
+                if k < len(sample):
+                    sample[k] = secs
+
+    start = time.time()
+    chunks = _sudokuChunks(infile, chunksize)
+    if processes > 1:
+        pool = multiprocessing.Pool(processes, _sudokuBatchInit,
+                                    (algo, model, variableHeuristic))
+        try:
+            pending = collections.deque()
+            for chunk in chunks:
+                pending.append(pool.apply_async(_sudokuBatchTask, (chunk,)))
+                if len(pending) >= 2*processes:
+                    write(pending.popleft().get())
+            while pending:
+                write(pending.popleft().get())
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        _sudokuBatchInit(algo, model, variableHeuristic)
+        for chunk in chunks:
+            write(_sudokuBatchTask(chunk))
+    outfile.flush()
+    secs = time.time() - start
+    boards = stats['boards']
+    if boards:
+        sample.sort()
+        print >>sys.stderr, "Solved {} boards in {:.2f}s ({:.0f} boards/sec), per board p50 {:.3f}ms p99 {:.3f}ms".format(
+            boards, secs, boards / max(secs, 1e-9),
+            1000*sample[len(sample) // 2], 1000*sample[min(len(sample) - 1, int(0.99*len(sample)))])
+    return boards
+
+def _sudokuChunks(infile, chunksize):
+    #lists of up to chunksize non blank lines
+    chunk = []
+    for line in infile:
+        line = line.strip()
+        if line:
+            chunk.append(line)
+            if len(chunk) == chunksize:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+#the settings of the batch solver in the current (worker) process
+_sudokuBatch = dict()
+
+def _sudokuBatchInit(algo, model, variableHeuristic):
+    _sudokuBatch['algo'] = algo
+    _sudokuBatch['model'] = model
+    _sudokuBatch['varHeur'] = variableHeuristic
+    if algo in ['BITS', 'DLX']:
+        _sudokuBatch['vars'] = cellVariables()
+    else:
+        _sudokuBatch['template'] = SudokuTemplate(3, model)
+
+def _sudokuBatchTask(chunk):
+    #list of (output line, secs) of a chunk of lines
+    results = []
+    for line in chunk:
+        start = time.time()
+        board = sudoku_parse(line)
+        if board is None:
+            results.append(("Invalid board", time.time() - start))
+            continue
+        algo = _sudokuBatch['algo']
+        if algo == 'BITS':
+            vars = _sudokuBatch['vars']
+            s = bitSolve(board, vars)
+        elif algo == 'DLX':
+            vars = _sudokuBatch['vars']
+            s = next(sudokuSolutions(board, vars), None)
+        else:
+            csp = _sudokuBatch['template'].load(board)
+            vars = csp.variables()
+            solutions, num_nodes = bt_search(algo, csp, _sudokuBatch['varHeur'], False, False)
+            s = solutions[0] if solutions else None
+        if s is None:
+            out = "No solution"
+        else:
+            values = dict(s)
+            out = ''.join([str(values[v]) for v in vars])
+        results.append((out, time.time() - start))
+    return results
 
 ##################################################################
 ### Plane Sequencing
@@ -299,8 +652,264 @@ class PlaneProblem:
             set(self._can_fly[plane]).intersection(
                 self._flights_at_start[plane]))
 
+def plane_sequence_dfa(planes_problem, plane):
+    '''Return (transitions, start, accepting) of a DFA accepting the
+       legal position sequences of plane: a (possibly empty) sequence
+       of flights the plane can fly, starting with one it can start
+       with, each following the previous one, with no run of
+       min_maintenance_frequency flights without maintenance, followed
+       by 0s (no flight). The states are 'start', 'end' (only 0s from
+       now on) and (f, c), the last flight was f and c flights have
+       been flown since the last maintenance.'''
+    can_fly = planes_problem.can_fly(plane)
+    k = planes_problem.min_maintenance_frequency
+    maintenance = set(planes_problem.maintenance_flights)
+    follows = dict()
+    for (f1, f2) in planes_problem.can_follow:
+        follows.setdefault(f1, []).append(f2)
+
+    def step(f, c):
+        if f in maintenance:
+            return (f, 0)
+        if c + 1 < k:
+            return (f, c + 1)
+        return None     #k flights without maintenance
+
+    transitions = {('start', 0): 'end', ('end', 0): 'end'}
+    todo = []
+    for f in planes_problem.can_start(plane):
+        state = step(f, 0)
+        if state:
+            transitions[('start', f)] = state
+            todo.append(state)
+    seen = set(todo)
+    while todo:
+        (f, c) = todo.pop()
+        transitions[((f, c), 0)] = 'end'
+        for g in follows.get(f, []):
+            if g not in can_fly:
+                continue
+            state = step(g, c)
+            if state:
+                transitions[((f, c), g)] = state
+                if state not in seen:
+                    seen.add(state)
+                    todo.append(state)
+    accepting = ['start', 'end'] + list(seen)
+    return transitions, 'start', accepting
+
+def planes_csp(planes_problem, model='pairwise'):
+    '''Return the CSP solve_planes solves for planes_problem (see
+       solve_planes for the models). The variables are named
+       "plane,position" and their value is the flight the plane flies
+       at that position (0 for no flight). For the successor model
+       see planes_successor_csp.'''
+    if not model in ['pairwise', 'regular', 'successor']:
+        print "Error wrong plane model specified {}. Must be one of {}".format(
+            model, ['pairwise', 'regular', 'successor'])
+    if model == 'successor':
+        return planes_successor_csp(planes_problem)
+
+    # Get essential infomation from the plane problem
+    planes = planes_problem.planes[:]
+    flights = planes_problem.flights[:]
+    flight_can_fly = planes_problem._can_fly#Take plane as index
+    flight_start = planes_problem._flights_at_start#Take plane as index
+    flight_follow = planes_problem.can_follow[:]
+    maintenance_pos = planes_problem.maintenance_flights[:]
+    maintenance_fre = planes_problem.min_maintenance_frequency
+
+    #First define the variables: 
+    #use a position in each plane's flight sequence as variables(format:'plane,position'), value is the flight.
+    #e.g. Variable: name 'AC-1,0' with the value AC001 indicates AC-1 will fly AC001 first
+    var_array = []
+    for i in range(len(planes)):
+        var_array.append([])
+        dom = [0]# 0 indicates no flight in this position 
+        dom.extend(flight_can_fly[planes[i]])
+        for j in range(len(flight_can_fly[planes[i]])):
+            var = Variable("{},{}".format(planes[i], j), dom)
+            var_array[i].append(var)
+
+    
+    #Set up the constraints
+    constraint_list = []
+
+    if model == 'regular':
+        #One regular constraint per plane covers the starting flight,
+        #the can follow pairs and maintenance
+        for i in range(len(var_array)):
+            if not var_array[i]:
+                continue
+            transitions, start, accepting = plane_sequence_dfa(planes_problem, planes[i])
+            constraint_list.append(RegularConstraint("[{}] flight sequence".format(planes[i]),
+                var_array[i], transitions, start, accepting))
+    else:
+        #Flights can be connected (Use table constraints)
+        #(0,0), (flight,0) are also considered as valid connections
+        valid_connect = [[0,0]]
+        for pair in flight_follow:
+            valid_connect.append(list(pair))
+        for flight in flights:
+            valid_connect.append([flight, 0])
+    
+        for i in range(len(var_array)):
+            for j in range(len(var_array[i]) - 1):
+                [start, end] = [var_array[i][j], var_array[i][j+1]]
+                constraint_list.extend([TableConstraint("[{}] flights can follow".format(var_array[i]),\
+                [start, end], valid_connect)])
+
+        #Valid initial flight constraints
+        for i in range(len(var_array)):
+            initial_flight = var_array[i][0]
+            valid_values = [[0]]
+            for start in flight_start[planes[i]]:
+                valid_values.append([start])
+            constraint_list.extend([TableConstraint("[{}] valid initial flight".format(initial_flight),\
+                [initial_flight], valid_values)])
+        
+        #Maintenance constraints (Use one SequenceConstraint per plane,
+        #every window of maintenance_fre positions needs a maintenance)
+        #Add 0 to required values because a sequence is valid 
+        #if the length is less than maintenance frequency
+        required_values = [0]
+        required_values.extend(maintenance_pos)
+        for i in range(len(var_array)):
+            constraint_list.extend([SequenceConstraint("[{}] maintenance".format(planes[i]), \
+            var_array[i], required_values, maintenance_fre, 1, maintenance_fre)])
+    
+    # Cover all flights and no more than once
+    vars = [var for row in var_array for var in row]
+    constraint_list.extend([coverAllFlight("cover all flight", vars, flights)])
+    
+    return CSP("planeSchedule", vars, constraint_list)
+
+def planes_successor_csp(planes_problem):
+    '''Return the successor model of planes_problem. Its size is
+       linear in the number of flights and planes:
+
+       "first,P"  the first flight of plane P, or ('end', P) if P flies
+                  nothing
+       "next,F"   the flight following flight F in its plane's sequence,
+                  or ('end', P) if F is the last flight of plane P
+       "plane,F"  the plane flying F
+       "count,F"  the number of flights since the last maintenance
+                  (0 for a maintenance flight), at most
+                  min_maintenance_frequency-1
+       plus the constant labels "plane,start P" and "count,start P"
+       of the start of each plane's sequence.
+
+       An AllDiffConstraint on the first and next variables gives
+       each flight and each end one predecessor, and a
+       NoCycleConstraint on the next variables makes the successors
+       form one path per plane. SuccessorConstraints carry the plane
+       and the maintenance count along the paths.'''
+    planes = planes_problem.planes
+    flights = planes_problem.flights
+    maintenance = set(planes_problem.maintenance_flights)
+    k = planes_problem.min_maintenance_frequency
+    follows = dict([(f, []) for f in flights])
+    for (f1, f2) in planes_problem.can_follow:
+        if f2 not in follows[f1]:
+            follows[f1].append(f2)
+    flownBy = dict([(f, []) for f in flights])
+    for p in planes:
+        for f in planes_problem.can_fly(p):
+            flownBy[f].append(p)
+
+    first = dict()
+    startPlane = dict()
+    startCount = dict()
+    for p in planes:
+        starts = planes_problem.can_start(p)
+        first[p] = Variable("first,{}".format(p),
+                            [f for f in planes_problem.can_fly(p) if f in starts] + [('end', p)])
+        startPlane[p] = Variable("plane,start {}".format(p), [p])
+        startCount[p] = Variable("count,start {}".format(p), [0])
+    succ = dict()
+    plane = dict()
+    count = dict()
+    for f in flights:
+        succ[f] = Variable("next,{}".format(f), follows[f] + [('end', p) for p in flownBy[f]])
+        plane[f] = Variable("plane,{}".format(f), flownBy[f])
+        count[f] = Variable("count,{}".format(f), [0] if f in maintenance else range(1, k))
+
+    def samePlane(a, b):
+        return a == b
+
+    def counts(g):
+        if g in maintenance:
+            return lambda a, b: b == 0
+        return lambda a, b: b == a + 1
+
+    def endOf(p):
+        return lambda a: a == p
+
+    constraint_list = [AllDiffConstraint("flight predecessors",
+                                         [first[p] for p in planes] + [succ[f] for f in flights]),
+                       NoCycleConstraint("flight sequences", [succ[f] for f in flights], flights)]
+    for p in planes:
+        nxt = planes_problem.can_fly(p)
+        constraint_list.append(SuccessorConstraint("[{}] first plane".format(p), first[p], startPlane[p],
+            dict([(g, (plane[g], samePlane)) for g in nxt])))
+        constraint_list.append(SuccessorConstraint("[{}] first count".format(p), first[p], startCount[p],
+            dict([(g, (count[g], counts(g))) for g in nxt])))
+    for f in flights:
+        planeTargets = dict([(g, (plane[g], samePlane)) for g in follows[f]])
+        for p in flownBy[f]:
+            planeTargets[('end', p)] = (None, endOf(p))
+        constraint_list.append(SuccessorConstraint("[{}] next plane".format(f), succ[f], plane[f], planeTargets))
+        constraint_list.append(SuccessorConstraint("[{}] next count".format(f), succ[f], count[f],
+            dict([(g, (count[g], counts(g))) for g in follows[f]])))
+
+    vars = [first[p] for p in planes] + [startPlane[p] for p in planes] + \
+           [startCount[p] for p in planes]
+    for f in flights:
+        vars.extend([succ[f], plane[f], count[f]])
+    return CSP("planeSchedule", vars, constraint_list)
+
+def planes_successor_schedule(planes_problem, s):
+    '''Convert a solution of planes_successor_csp (a list of (var,
+       value) pairs) into the schedule format of solve_planes'''
+    values = dict([(var.name(), val) for (var, val) in s])
+    single_solution = []
+    for p in sorted([p for p in planes_problem.planes if planes_problem.can_fly(p)]):
+        lst = [p]
+        f = values["first,{}".format(p)]
+        while f != ('end', p):
+            lst.append(f)
+            f = values["next,{}".format(f)]
+        single_solution.append(lst)
+    return single_solution
+
+def planes_schedule(s):
+    '''Convert a solution of planes_csp (a list of (var, value) pairs)
+       into the schedule format of solve_planes'''
+    single_solution = []
+    sol = dict()#sol = {'AC-1':(0, AC01),(1, AC02),(2, AC03)}
+    for (var, val) in s:
+        plane_name = var.name().split(',')[0]
+        position = var.name().split(',')[1]
+        if plane_name in sol:
+            sol[plane_name].append([position, val])
+        else:
+            sol[plane_name] = []
+            sol[plane_name].append([position, val])
+    keys = sol.keys()
+    keys.sort()
+    for key in keys:
+        lst = [key]
+        seq = sol[key]
+        for pos in seq:
+            flight = pos[1]
+            if flight != 0:
+                lst.append(flight)
+        single_solution.append(lst)
+    return single_solution
+
 def solve_planes(planes_problem, algo, allsolns,
-                 variableHeuristic='mrv', silent=False, trace=False):
+                 variableHeuristic='mrv', silent=False, trace=False,
+                 model='pairwise'):
     #Your implementation for Question 6 goes here.
     #
     #Do not but do not change the functions signature
@@ -337,79 +946,24 @@ def solve_planes(planes_problem, algo, allsolns,
 
        The returned list of lists should contain a list for every
        plane.
-    '''
 
-    #BUILD your CSP here and store it in the varable csp
-    def planeCSP(planes_problem):
-        """My code start"""
-        # Get essential infomation from the plane problem
-        planes = planes_problem.planes[:]
-        flights = planes_problem.flights[:]
-        flight_can_fly = planes_problem._can_fly#Take plane as index
-        flight_start = planes_problem._flights_at_start#Take plane as index
-        flight_follow = planes_problem.can_follow[:]
-        maintenance_pos = planes_problem.maintenance_flights[:]
-        maintenance_fre = planes_problem.min_maintenance_frequency
-
-        #First define the variables: 
-        #use a position in each plane's flight sequence as variables(format:'plane,position'), value is the flight.
-        #e.g. Variable: name 'AC-1,0' with the value AC001 indicates AC-1 will fly AC001 first
-        var_array = []
-        for i in range(len(planes)):
-            var_array.append([])
-            dom = [0]# 0 indicates no flight in this position 
-            dom.extend(flight_can_fly[planes[i]])
-            for j in range(len(flight_can_fly[planes[i]])):
-                var = Variable("{},{}".format(planes[i], j), dom)
-                var_array[i].append(var)
+       model selects how each plane's sequence is constrained:
+       'pairwise' uses a table constraint for every pair of adjacent
+       positions plus a table for the first flight and a
+       SequenceConstraint for the maintenance windows. 'regular' uses a
+       single RegularConstraint per plane (see plane_sequence_dfa).
+       'successor' uses the next flight of every flight instead of
+       the flight at every position (see planes_successor_csp).
 
-        
-        #Set up the constraints
-        constraint_list = []
-
-        #Flights can be connected (Use table constraints)
-        #(0,0), (flight,0) are also considered as valid connections
-        valid_connect = [[0,0]]
-        for pair in flight_follow:
-            valid_connect.append(list(pair))
-        for flight in flights:
-            valid_connect.append([flight, 0])
-        
-        for i in range(len(var_array)):
-            for j in range(len(var_array[i]) - 1):
-                [start, end] = [var_array[i][j], var_array[i][j+1]]
-                constraint_list.extend([TableConstraint("[{}] flights can follow".format(var_array[i]),\
-                [start, end], valid_connect)])
-
-        #Valid initial flight constraints
-        for i in range(len(var_array)):
-            initial_flight = var_array[i][0]
-            valid_values = [[0]]
-            for start in flight_start[planes[i]]:
-                valid_values.append([start])
-            constraint_list.extend([TableConstraint("[{}] valid initial flight".format(initial_flight),\
-                [initial_flight], valid_values)])
-            
-        #Maintenance constraints (Use NValuesConstraint)
-        #Add 0 to required values because a sequence is valid 
-        #if the length is less than maintenance frequency
-        required_values = [0]
-        required_values.extend(maintenance_pos)
-        for i in range(len(var_array)):
-            for j in range(len(var_array[i]) - maintenance_fre + 1):
-                test_scope = var_array[i][j:j+maintenance_fre]
-                constraint_list.extend([NValuesConstraint("[{}] maintenance".format(var_array[i]), \
-                test_scope, required_values, 1, maintenance_fre)])
-        
-        # Cover all flights and no more than once
-        vars = [var for row in var_array for var in row]
-        constraint_list.extend([coverAllFlight("cover all flight", vars, flights)])
-        
-        return CSP("planeSchedule", vars, constraint_list)
-
-                
+       algo 'LNS' returns the single schedule found by
+       solve_planes_lns with its default options.
+    '''
+    if algo == 'LNS':
+        return solve_planes_lns(planes_problem, variableHeuristic=variableHeuristic,
+                                silent=silent, model=model)
 
-    csp = planeCSP(planes_problem)
+    #BUILD your CSP here and store it in the varable csp
+    csp = planes_csp(planes_problem, model)
 
     #invoke search with the passed parameters
     solutions, num_nodes = bt_search(algo, csp, variableHeuristic, allsolns, trace)
@@ -424,27 +978,267 @@ def solve_planes(planes_problem, algo, allsolns,
             print "No solutions to {} found".format(csp.name())
     else:
         for s in solutions:
-            single_solution = []
-            sol = dict()#sol = {'AC-1':(0, AC01),(1, AC02),(2, AC03)}
-            for (var, val) in s:
-                plane_name = var.name().split(',')[0]
-                position = var.name().split(',')[1]
-                if plane_name in sol:
-                    sol[plane_name].append([position, val])
-                else:
-                    sol[plane_name] = []
-                    sol[plane_name].append([position, val])
-            keys = sol.keys()
-            keys.sort()
-            for key in keys:
-                lst = [key]
-                seq = sol[key]
-                for pos in seq:
-                    flight = pos[1]
-                    if flight != 0:
-                        lst.append(flight)
-                single_solution.append(lst)
-            all_solutions.append(single_solution)
+            if model == 'successor':
+                all_solutions.append(planes_successor_schedule(planes_problem, s))
+            else:
+                all_solutions.append(planes_schedule(s))
 
     return all_solutions
-            
+
+def planes_components(planes_problem):
+    '''Split planes_problem into independent problems: the connected
+       components of the graph linking each plane to the flights it
+       can fly (planes that can't fly any flight are left out). Returns
+       the list of the component PlaneProblems, or None if some flight
+       can't be flown by any plane (there is no schedule).'''
+    parent = dict()
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for f in planes_problem.flights:
+        parent[('flight', f)] = ('flight', f)
+    planes = [p for p in planes_problem.planes if planes_problem.can_fly(p)]
+    for p in planes:
+        parent[('plane', p)] = ('plane', p)
+        for f in planes_problem.can_fly(p):
+            parent[find(('flight', f))] = find(('plane', p))
+    roots = []
+    members = dict()    #root --> (planes, flights)
+    for p in planes:
+        root = find(('plane', p))
+        if root not in members:
+            roots.append(root)
+            members[root] = ([], [])
+        members[root][0].append(p)
+    for f in planes_problem.flights:
+        root = find(('flight', f))
+        if root not in members:
+            return None     #no plane can fly f
+        members[root][1].append(f)
+
+    components = []
+    for root in roots:
+        cplanes, cflights = members[root]
+        inside = set(cflights)
+        components.append(PlaneProblem(
+            cplanes, cflights,
+            [[p] + planes_problem.can_fly(p) for p in cplanes],
+            [[p] + [f for f in planes_problem._flights_at_start[p] if f in inside] for p in cplanes],
+            [(f1, f2) for (f1, f2) in planes_problem.can_follow if f1 in inside and f2 in inside],
+            [f for f in planes_problem.maintenance_flights if f in inside],
+            planes_problem.min_maintenance_frequency))
+    return components
+
+def solve_planes_components(planes_problem, algo, allsolns,
+                            variableHeuristic='mrv', silent=False, model='pairwise',
+                            processes=1):
+    '''Solve each component of planes_problem (see planes_components)
+       on its own with solve_planes, using that many worker processes
+       if processes > 1. Returns a SolutionProduct of the components'
+       schedules: iterating it gives the schedules of the whole
+       problem (in the format of solve_planes) without storing them
+       all, and count() is their number. The components share no
+       plane or flight, so every combination is a schedule.'''
+    components = planes_components(planes_problem)
+    if components is None:
+        if not silent:
+            print "No solutions to planeSchedule found (a flight can't be flown by any plane)"
+        return SolutionProduct([[]])
+    tasks = [(c, algo, allsolns, variableHeuristic, model) for c in components]
+    if processes > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(min(processes, len(tasks)))
+        try:
+            parts = pool.map(_planesComponentTask, tasks, 1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        parts = map(_planesComponentTask, tasks)
+    product = SolutionProduct(parts, lambda schedules: sorted(
+        [l for schedule in schedules for l in schedule], key=lambda l: l[0]))
+    if not silent:
+        print "{} components, {} solutions".format(len(components), product.count())
+    return product
+
+def _planesComponentTask(task):
+    component, algo, allsolns, variableHeuristic, model = task
+    return solve_planes(component, algo, allsolns, variableHeuristic, True, model=model)
+
+def count_planes(planes_problem, model='pairwise', cacheSize=100000, silent=False):
+    '''Return the number of schedules of planes_problem, counted without
+       generating them, so it works for problems with far too many
+       schedules to enumerate. coverAllFlight links every plane in
+       planes_csp, so the problem is first split into its components
+       (see planes_components) and the solutions of each component's
+       planes_csp are counted by countSolutions.'''
+    components = planes_components(planes_problem)
+    if components is None:
+        if not silent:
+            print "No solutions to planeSchedule found (a flight can't be flown by any plane)"
+        return 0
+    n = 1
+    nodes = hits = 0
+    for c in components:
+        stats = dict()
+        n *= countSolutions(planes_csp(c, model), cacheSize, stats)
+        nodes += stats['nodes']
+        hits += stats['hits']
+        if not n:
+            break
+    if not silent:
+        print "{} components, {} solutions ({} nodes, {} cache hits)".format(
+            len(components), n, nodes, hits)
+    return n
+
+def planes_schedule_cost(planes_problem, schedule):
+    '''The cost solve_planes_lns minimises: for every plane, the
+       squares of the lengths of the runs of flights without
+       maintenance (including the run after its last maintenance),
+       summed. So schedules that bring planes to maintenance more
+       often are better.'''
+    maintenance = set(planes_problem.maintenance_flights)
+    return sum([_planeCost(maintenance, l[1:]) for l in schedule])
+
+def _planeCost(maintenance, flights):
+    cost = 0
+    run = 0
+    for f in flights:
+        if f in maintenance:
+            cost += run * run
+            run = 0
+        else:
+            run += 1
+    return cost + run * run
+
+def solve_planes_lns(planes_problem, timeLimit=10.0, relax=2, nodeLimit=1000,
+                     neighbourhoods=None, processes=1,
+                     variableHeuristic='mrv', silent=False, model='pairwise'):
+    '''Large neighbourhood search for a good (low planes_schedule_cost)
+       schedule. Starts from the first schedule GAC finds, then in
+       every round relaxes the flight sequences of relax planes, keeping
+       the other planes' sequences fixed, and searches that
+       neighbourhood with GAC (all solutions, up to nodeLimit nodes),
+       keeping the best schedule found if it improves on the current
+       one.
+
+       The relaxed planes are chosen by one of the neighbourhoods,
+       picked at random each time (all three by default):
+       'random'  random planes
+       'related' a random plane and the planes that can fly the most
+                 of its flights (they can take them over)
+       'worst'   the planes with the highest maintenance cost
+
+       With processes > 1 each round searches that many
+       neighbourhoods in parallel. Stops after the round in which
+       timeLimit seconds have passed. Returns a list with the best
+       schedule, in the format of solve_planes (an empty list if
+       there is no schedule at all).'''
+    start = time.time()
+    if neighbourhoods is None:
+        neighbourhoods = ['random', 'related', 'worst']
+    initial = solve_planes(planes_problem, 'GAC', False, variableHeuristic, True, model=model)
+    if not initial:
+        if not silent:
+            print "No solutions to planeSchedule found"
+        return []
+    best = initial[0]
+    bestCost = planes_schedule_cost(planes_problem, best)
+    if not silent:
+        print "LNS initial schedule cost {}".format(bestCost)
+    pool = None
+    if processes > 1:
+        pool = multiprocessing.Pool(processes)
+    rounds = 0
+    try:
+        while time.time() - start < timeLimit and bestCost > 0:
+            rounds += 1
+            tasks = []
+            for i in range(max(processes, 1)):
+                kind = random.choice(neighbourhoods)
+                relaxed = _planesNeighbourhood(planes_problem, best, kind, relax)
+                tasks.append((planes_problem, best, relaxed, nodeLimit, variableHeuristic, model))
+            if pool:
+                results = pool.map(_planesLnsTask, tasks, 1)
+            else:
+                results = map(_planesLnsTask, tasks)
+            for schedule in results:
+                if schedule is None:
+                    continue
+                cost = planes_schedule_cost(planes_problem, schedule)
+                if cost < bestCost:
+                    best, bestCost = schedule, cost
+                    if not silent:
+                        print "LNS round {}: schedule cost {}".format(rounds, bestCost)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    if not silent:
+        print "LNS stopped after {} rounds ({:.1f}s), best cost {}".format(
+            rounds, time.time() - start, bestCost)
+    return [best]
+
+def _planesNeighbourhood(planes_problem, schedule, kind, relax):
+    '''return the list of planes to relax'''
+    planes = list(planes_problem.planes)
+    relax = min(relax, len(planes))
+    random.shuffle(planes)     #random tie breaking
+    if kind == 'random':
+        return planes[:relax]
+    if kind == 'related':
+        flights = dict([(l[0], l[1:]) for l in schedule])
+        p = planes[0]
+        def shared(q):
+            return len(set(flights[p]).intersection(planes_problem.can_fly(q)))
+        others = sorted(planes[1:], key=shared, reverse=True)
+        return [p] + others[:relax - 1]
+    if kind == 'worst':
+        maintenance = set(planes_problem.maintenance_flights)
+        costs = dict([(l[0], _planeCost(maintenance, l[1:])) for l in schedule])
+        return sorted(planes, key=lambda q: costs[q], reverse=True)[:relax]
+    print "Error unknown LNS neighbourhood {}. Must be one of {}".format(
+        kind, ['random', 'related', 'worst'])
+    return planes[:relax]
+
+def _planesLnsTask(task):
+    '''Search the schedules that only change the sequences of the
+       relaxed planes, return the best one found (or None)'''
+    planes_problem, schedule, relaxed, nodeLimit, variableHeuristic, model = task
+    csp = planes_csp(planes_problem, model)
+    flights = dict([(l[0], l[1:]) for l in schedule])
+    if model == 'successor':
+        #fix the successors and planes of the kept planes' flights
+        fixed = dict()
+        for plane, seq in flights.items():
+            if plane not in relaxed:
+                path = seq + [('end', plane)]
+                fixed["first,{}".format(plane)] = path[0]
+                for i, f in enumerate(seq):
+                    fixed["next,{}".format(f)] = path[i + 1]
+                    fixed["plane,{}".format(f)] = plane
+        for v in csp.variables():
+            if v.name() in fixed:
+                v.resetDomain([fixed[v.name()]])
+    else:
+        for v in csp.variables():
+            plane, position = v.name().split(',')
+            if plane not in relaxed:
+                seq = flights[plane]
+                position = int(position)
+                v.resetDomain([seq[position] if position < len(seq) else 0])
+    solutions, num_nodes = bt_search('GAC', csp, variableHeuristic, True, False, nodeLimit)
+    best = None
+    bestCost = None
+    for s in solutions:
+        if model == 'successor':
+            candidate = planes_successor_schedule(planes_problem, s)
+        else:
+            candidate = planes_schedule(s)
+        cost = planes_schedule_cost(planes_problem, candidate)
+        if bestCost is None or cost < bestCost:
+            best, bestCost = candidate, cost
+    return best
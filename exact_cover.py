@@ -0,0 +1,312 @@
+from csp import Variable
+from constraints import AllDiffConstraint, GlobalCardinalityConstraint
+
+class DancingLinks:
+    '''Exact cover with Knuth's Algorithm X and dancing links.
+
+       columns is a list of the primary columns (each must be covered
+       exactly once), secondary an optional list of secondary columns
+       (each can be covered at most once) and rows a list of (name,
+       columns) pairs: the row name and the list of the columns it
+       covers.
+       A solution is a list of row names covering every primary
+       column exactly once and no secondary column more than once
+       (rows covering only secondary columns are never used).
+
+       The matrix is stored as circular doubly linked lists (the
+       arrays L, R, U, D of node indices, node 0 is the root and
+       nodes 1..#columns the column headers), so covering a column
+       (removing it and every row using it) and uncovering it
+       (relinking in the reverse order) only touch the nodes removed.
+       The search branches on the primary column with the fewest
+       rows left.
+
+       accept and retract (optional functions of a row name) are
+       called when a row is added to the partial solution and when it
+       is removed again. If accept returns False the row is skipped,
+       e.g., to check constraints that aren't part of the cover.'''
+
+    def __init__(self, columns, rows, secondary=None, accept=None, retract=None):
+        allColumns = list(columns) + list(secondary or [])
+        n = len(allColumns)
+        self._colIndex = dict()
+        for i, c in enumerate(allColumns):
+            self._colIndex[c] = i + 1
+        #headers, primary columns are linked to the root
+        self._L = range(-1, n)
+        self._R = range(1, n + 2)
+        self._L[0] = len(columns)
+        self._R[len(columns)] = 0
+        for i in range(len(columns) + 1, n + 1):
+            self._L[i] = self._R[i] = i   #secondary columns are not in the ring
+        self._U = range(n + 1)
+        self._D = range(n + 1)
+        self._C = range(n + 1)
+        self._S = [0] * (n + 1)
+        self._rowOf = [None] * (n + 1)
+        self._names = []
+        for (name, cols) in rows:
+            self._addRow(name, cols)
+        self._accept = accept
+        self._retract = retract
+
+    def _addRow(self, name, cols):
+        L, R, U, D, C, S = self._L, self._R, self._U, self._D, self._C, self._S
+        r = len(self._names)
+        self._names.append(name)
+        first = None
+        for col in cols:
+            c = self._colIndex[col]
+            x = len(C)
+            C.append(c)
+            self._rowOf.append(r)
+            #insert at the bottom of column c
+            U.append(U[c])
+            D.append(c)
+            D[U[c]] = x
+            U[c] = x
+            S[c] += 1
+            if first is None:
+                first = x
+                L.append(x)
+                R.append(x)
+            else:
+                L.append(L[first])
+                R.append(first)
+                R[L[first]] = x
+                L[first] = x
+
+    def _cover(self, c):
+        L, R, U, D, C, S = self._L, self._R, self._U, self._D, self._C, self._S
+        R[L[c]] = R[c]
+        L[R[c]] = L[c]
+        i = D[c]
+        while i != c:
+            j = R[i]
+            while j != i:
+                D[U[j]] = D[j]
+                U[D[j]] = U[j]
+                S[C[j]] -= 1
+                j = R[j]
+            i = D[i]
+
+    def _uncover(self, c):
+        L, R, U, D, C, S = self._L, self._R, self._U, self._D, self._C, self._S
+        i = U[c]
+        while i != c:
+            j = L[i]
+            while j != i:
+                S[C[j]] += 1
+                D[U[j]] = j
+                U[D[j]] = j
+                j = L[j]
+            i = U[i]
+        R[L[c]] = c
+        L[R[c]] = c
+
+    def _select(self, r):
+        '''try to add the row of node r to the solution, covering its
+           other columns'''
+        if self._accept and not self._accept(self._names[self._rowOf[r]]):
+            return False
+        R, C = self._R, self._C
+        j = R[r]
+        while j != r:
+            self._cover(C[j])
+            j = R[j]
+        return True
+
+    def _unselect(self, r):
+        L, C = self._L, self._C
+        j = L[r]
+        while j != r:
+            self._uncover(C[j])
+            j = L[j]
+        if self._retract:
+            self._retract(self._names[self._rowOf[r]])
+
+    def _nextRow(self, r, c):
+        '''the first node from r down column c whose row can be
+           selected (and is), None if there is none'''
+        D = self._D
+        while r != c:
+            if self._select(r):
+                return r
+            r = D[r]
+        return None
+
+    def solutions(self):
+        '''Generate the solutions, each a list of row names'''
+        R, D, C, S = self._R, self._D, self._C, self._S
+        chosen = []    #node of the row chosen at each level
+        while True:
+            if R[0] == 0:
+                try:
+                    yield [self._names[self._rowOf[r]] for r in chosen]
+                except GeneratorExit:
+                    #stopped early, undo the partial solution
+                    while chosen:
+                        r = chosen.pop()
+                        self._unselect(r)
+                        self._uncover(C[r])
+                    raise
+            else:
+                #primary column with the fewest rows
+                c = R[0]
+                best = c
+                while c != 0:
+                    if S[c] < S[best]:
+                        best = c
+                    c = R[c]
+                if S[best] > 0:
+                    self._cover(best)
+                    r = self._nextRow(D[best], best)
+                    if r is not None:
+                        chosen.append(r)
+                        continue
+                    self._uncover(best)
+            #backtrack to the last level with another row to try
+            while True:
+                if not chosen:
+                    return
+                r = chosen.pop()
+                self._unselect(r)
+                c = C[r]
+                r = self._nextRow(D[r], c)
+                if r is not None:
+                    chosen.append(r)
+                    break
+                self._uncover(c)
+
+    def count(self, limit=None):
+        '''Return the number of solutions (stopping at limit if given,
+           e.g., limit=2 to check that a solution is unique)'''
+        found = 0
+        search = self.solutions()
+        for s in search:
+            found += 1
+            if limit is not None and found >= limit:
+                search.close()   #undoes the covering of the stopped search
+                break
+        return found
+
+def sudokuExactCover(board):
+    '''Return the DancingLinks problem of a sudoku board (given in the
+       format of sudokuCSP). Its rows are named (i, j, v), value v
+       in the cell of row i and column j (1..9), one for each value
+       of an empty cell and one for each filled cell. The columns are
+       the cells, and the pairs (row, value), (column, value) and
+       (box, value).'''
+    columns = []
+    for a in range(9):
+        for b in range(9):
+            columns.extend([('cell', a, b), ('row', a, b + 1),
+                            ('col', a, b + 1), ('box', a, b + 1)])
+    rows = []
+    for i in range(9):
+        for j in range(9):
+            if board[i][j] == 0:
+                values = range(1, 10)
+            else:
+                values = [board[i][j]]
+            for v in values:
+                rows.append(((i + 1, j + 1, v),
+                             [('cell', i, j), ('row', i, v), ('col', j, v),
+                              ('box', 3 * (i // 3) + j // 3, v)]))
+    return DancingLinks(columns, rows)
+
+def sudokuSolutions(board, vars=None):
+    '''Generate the solutions of a sudoku board with dancing links,
+       each a list of (var, value) pairs as returned by bt_search.
+       vars is the list of the 81 cell variables, in row order, named
+       as in sudokuCSP (created if not given).'''
+    if vars is None:
+        vars = [Variable("V{},{}".format(i, j), range(1, 10))
+                for i in range(1, 10) for j in range(1, 10)]
+    for s in sudokuExactCover(board).solutions():
+        s.sort()
+        yield [(vars[9 * (i - 1) + (j - 1)], v) for (i, j, v) in s]
+
+def sudokuCount(board, limit=None):
+    '''Return the number of solutions of a sudoku board (up to limit)'''
+    return sudokuExactCover(board).count(limit)
+
+def cspExactCover(csp):
+    '''Return the DancingLinks problem of the exact cover part of a
+       CSP. Its rows are the (var, val) pairs of the current domains.
+       Each variable is a primary column (it takes exactly one value).
+       The AllDiffConstraints and GlobalCardinalityConstraints with
+       bounds (1, 1) or (0, 1) become a column for each of their
+       values, primary if the value must be used exactly once (all
+       values of a permutation) and secondary if at most once.
+
+       The other constraints (and GlobalCardinalityConstraints with
+       other bounds) are checked as the rows are selected, each when
+       all its variables have been assigned, so the solutions are
+       exactly the solutions of the CSP. The variables are left
+       assigned to the current solution while the search is stopped
+       at it.'''
+    primary = [('var', v) for v in csp.variables()]
+    secondary = []
+    covered = dict()   #var --> list of (cnstr, offset)
+    side = set()
+    for c in csp.constraints():
+        if isinstance(c, AllDiffConstraint):
+            scope = c.scope()
+            offsets = c._offsets or [0] * len(scope)
+            values = set()
+            for i, v in enumerate(scope):
+                values.update([val + offsets[i] for val in v.curDomain()])
+            for val in values:
+                if len(values) == len(scope):
+                    primary.append((c, val))
+                else:
+                    secondary.append((c, val))
+            for i, v in enumerate(scope):
+                covered.setdefault(v, []).append((c, offsets[i]))
+        elif isinstance(c, GlobalCardinalityConstraint) and \
+                all([b in [(1, 1), (0, 1)] for b in c._bounds.values()]):
+            for val, b in c._bounds.items():
+                if b == (1, 1):
+                    primary.append((c, val))
+                else:
+                    secondary.append((c, val))
+            for v in c.scope():
+                covered.setdefault(v, []).append((c, None))
+        else:
+            side.add(c)
+    rows = []
+    for v in csp.variables():
+        for val in v.curDomain():
+            cols = [('var', v)]
+            for (c, offset) in covered.get(v, []):
+                if offset is None:
+                    if val in c._bounds:
+                        cols.append((c, val))
+                else:
+                    cols.append((c, val + offset))
+            rows.append(((v, val), cols))
+    sideOf = dict()
+    for v in csp.variables():
+        sideOf[v] = [c for c in csp.constraintsOf(v) if c in side]
+
+    def accept(row):
+        (var, val) = row
+        var.setValue(val)
+        for c in sideOf[var]:
+            if c.numUnassigned() == 0 and not c.check():
+                var.unAssign()
+                return False
+        return True
+
+    def retract(row):
+        row[0].unAssign()
+
+    return DancingLinks(primary, rows, secondary, accept, retract)
+
+def cspSolutions(csp):
+    '''Generate the solutions of csp found by cspExactCover, each a
+       list of (var, value) pairs (in the order of csp.variables())
+       as returned by bt_search'''
+    for s in cspExactCover(csp).solutions():
+        yield [(v, v.getValue()) for v in csp.variables()]
@@ -5,9 +5,14 @@ import argparse
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Solve the n-Queens csp problem')
     parser.add_argument("n", help="the number of queens in the problem", type=int)
-    parser.add_argument("-a", "--algorithm", help="which backtracking algorithm to use", choices=['BT', 'FC', 'GAC'], default='BT')
+    parser.add_argument("-a", "--algorithm", help="which backtracking algorithm to use", choices=['BT', 'FC', 'GAC', 'MC', 'BITS'], default='BT')
     parser.add_argument("-c", "--allSolns", help="Complete search (Find all solutions)", action="store_true")
     parser.add_argument("-t", "--tablecnstr", help="Use table constraint in csp", action="store_true")
+    parser.add_argument("-g", "--globalcnstr", help="Use a single n-queens constraint with this level of filtering", choices=['fc', 'gac'])
+    parser.add_argument("-v", "--varHeur", help="Variable heuristic", choices=['random', 'fixed', 'mrv'], default='fixed')
+    parser.add_argument("-n", "--count", help="Only print the number of solutions", action="store_true")
+    parser.add_argument("-p", "--processes", help="Worker processes for counting with BITS", type=int, default=1)
     args = parser.parse_args()
 
-    csp_problems.solve_nQueens(args.n, args.algorithm, args.allSolns, args.tablecnstr)
+    csp_problems.solve_nQueens(args.n, args.algorithm, args.allSolns, args.tablecnstr, args.varHeur,
+                               globalCnstr=args.globalcnstr, countOnly=args.count, processes=args.processes)
@@ -265,9 +265,14 @@ def check_all_flights_scheduled_once(pp, s):
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Solve a plane scheduling csp problem')
     parser.add_argument("p", help="The problem number to solve", type=int)
-    parser.add_argument("-a", "--algorithm", help="which backtracking algorithm to use", choices=['BT', 'FC', 'GAC'], default='GAC')
+    parser.add_argument("-a", "--algorithm", help="which backtracking algorithm to use", choices=['BT', 'FC', 'GAC', 'LNS'], default='GAC')
     parser.add_argument("-c", "--allSolns", help="Complete search (Find all solutions)", action="store_true")
     parser.add_argument("-v", "--varHeur", help="Heuristic for selecting next variable to assign", choices=['fixed', 'random', 'mrv'], default='mrv')
+    parser.add_argument("-m", "--model", help="Choose CSP model for the plane sequences/pairwise tables, regular constraints or successor variables", choices=['pairwise', 'regular', 'successor'], default='pairwise')
+    parser.add_argument("-t", "--time", help="Time budget in seconds for LNS", type=float, default=10.0)
+    parser.add_argument("-p", "--processes", help="Neighbourhoods LNS searches (or components solved with -d) in parallel", type=int, default=1)
+    parser.add_argument("-d", "--decompose", help="Solve the independent parts of the problem separately", action="store_true")
+    parser.add_argument("-n", "--count", help="Only print the number of solutions (with -c, counted without generating them)", action="store_true")
     args = parser.parse_args()
 
     if args.p < 1 or args.p > len(problems):
@@ -281,7 +286,24 @@ if __name__ == '__main__':
     print "Planes: {}".format(ip.planes)
     print "Flights: {}".format(ip.flights)
     print "Solving using {}".format(args.algorithm)
-    solns = csp_problems.solve_planes(ip, args.algorithm, args.allSolns, args.varHeur)
+    if args.count and args.allSolns and args.algorithm != 'LNS':
+        #count the schedules without generating them
+        csp_problems.count_planes(ip, args.model)
+        exit(0)
+    if args.algorithm == 'LNS':
+        solns = csp_problems.solve_planes_lns(ip, args.time, processes=args.processes,
+                                              variableHeuristic=args.varHeur, model=args.model)
+    elif args.decompose:
+        solns = csp_problems.solve_planes_components(ip, args.algorithm, args.allSolns, args.varHeur,
+                                                     model=args.model, processes=args.processes)
+    else:
+        solns = csp_problems.solve_planes(ip, args.algorithm, args.allSolns, args.varHeur, model=args.model)
+    if args.count:
+        if isinstance(solns, backtracking.SolutionProduct):
+            print "{} solutions".format(solns.count())
+        else:
+            print "{} solutions".format(len(solns))
+        exit(0)
     print ""
     for i,s in enumerate(solns):
         print "Solution {}.".format(i+1)
@@ -1,6 +1,9 @@
 import csp_problems
 import backtracking
+import sudoku_engine
 import argparse
+import sys
+import time
 
 #Sample boards
 #List of lists, each internal list is a row. 0 is empty cell, 1-9 is cell fixed to this value
@@ -80,15 +83,37 @@ boards = [b1, b2, b3, b4, b5, b6, b7]
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Solve a Sudoku csp problem')
-    parser.add_argument("b", help="The board number to solve", type=int)
-    parser.add_argument("-a", "--algorithm", help="which backtracking algorithm to use", choices=['BT', 'FC', 'GAC'], default='FC')
+    parser.add_argument("b", help="The board number to solve", type=int, nargs='?')
+    parser.add_argument("-a", "--algorithm", help="which backtracking algorithm to use (default FC, BITS with -f)", choices=['BT', 'FC', 'GAC', 'MC', 'DLX', 'BITS'])
     parser.add_argument("-e", "--gacEnforce", help="Don't use search only apply gacEnforce", action="store_true")
     parser.add_argument("-m", "--model", help="Choose CSP model/binary not equals or alldiff", choices=['neq', 'alldiff'], default='neq')
     parser.add_argument("-c", "--allSolns", help="Complete search (Find all solutions)", action="store_true")
     parser.add_argument("-v", "--varHeur", help="Heuristic for selecting next variable to assign", choices=['fixed', 'random', 'mv'], default='fixed')
+    parser.add_argument("-f", "--file", help="Solve every board of FILE (- for stdin), one line of 81 characters per board, printing a line for each")
+    parser.add_argument("-g", "--generate", help="Print GENERATE random puzzles with a unique solution, one line each with the number of givens, guesses and search nodes", type=int)
+    parser.add_argument("-s", "--seed", help="Random seed used with -g", type=int, default=0)
+    parser.add_argument("-p", "--processes", help="Number of worker processes used with -f or -g", type=int, default=1)
+    parser.add_argument("-k", "--chunk", help="Number of boards given to a worker at a time with -f", type=int, default=100)
     args = parser.parse_args()
 
-    if args.b < 1 or args.b > len(boards):
+    if args.generate:
+        start = time.time()
+        for board, metrics in sudoku_engine.generatePuzzles(args.generate, args.processes, args.seed):
+            print "{} {} {} {}".format(''.join([str(d) for row in board for d in row]),
+                                       metrics['givens'], metrics['guesses'], metrics['nodes'])
+        secs = time.time() - start
+        print >>sys.stderr, "Generated {} puzzles in {:.2f}s ({:.0f} puzzles/min)".format(
+            args.generate, secs, 60 * args.generate / max(secs, 1e-9))
+        exit(0)
+    if args.file:
+        infile = sys.stdin if args.file == '-' else open(args.file)
+        csp_problems.solve_sudoku_batch(infile, sys.stdout, args.algorithm or 'BITS', args.model,
+                                        args.varHeur, args.processes, args.chunk)
+        exit(0)
+    if args.algorithm is None:
+        args.algorithm = 'FC'
+
+    if args.b is None or args.b < 1 or args.b > len(boards):
         print "{} is invalid board number. I only know about boards {} to {}".format(args.b, 1, len(boards))
         print "If you want to add new boards add them to the list \"boards\""
         exit(1)
@@ -0,0 +1,258 @@
+'''A dedicated 9x9 sudoku solver for solving many boards quickly.
+
+   Instead of a CSP, the state of the search is a list of 81
+   candidate bitmasks (bit d-1 set if digit d is still possible in
+   the cell), in row order. Placing a digit removes it from the
+   cell's 20 peers, and a peer left with one candidate is placed in
+   turn (naked singles). Then every row, column and box is scanned
+   for digits with no place left (failure) or only one place (hidden
+   singles). When neither rule applies the search branches on the
+   cell with the fewest candidates (MRV), copying the 81 masks.'''
+
+from csp import Variable
+import multiprocessing
+import random
+
+ALL = 0x1FF
+
+UNITS = [[9 * r + c for c in range(9)] for r in range(9)] + \
+        [[9 * r + c for r in range(9)] for c in range(9)] + \
+        [[9 * (3 * (b // 3) + k // 3) + 3 * (b % 3) + k % 3 for k in range(9)] for b in range(9)]
+
+PEERS = []
+for _cell in range(81):
+    _peers = set()
+    for _unit in UNITS:
+        if _cell in _unit:
+            _peers.update(_unit)
+    _peers.discard(_cell)
+    PEERS.append(sorted(_peers))
+
+POPCOUNT = [bin(m).count('1') for m in range(ALL + 1)]
+DIGIT = dict([(1 << d, d + 1) for d in range(9)])   #single bit --> digit
+
+def _assign(cand, cell, bit, PEERS=PEERS, POPCOUNT=POPCOUNT):
+    '''place bit in cell and propagate the naked singles, return
+       False on a contradiction'''
+    cand[cell] = bit
+    todo = [cell]
+    while todo:
+        c = todo.pop()
+        b = cand[c]
+        for p in PEERS[c]:
+            m = cand[p]
+            if m & b:
+                m ^= b
+                if not m:
+                    return False
+                cand[p] = m
+                if POPCOUNT[m] == 1:
+                    todo.append(p)
+    return True
+
+def _hiddenSingles(cand, UNITS=UNITS, POPCOUNT=POPCOUNT):
+    '''place the digits that have one place left in some unit (one
+       pass over the units), return False on a contradiction'''
+    for unit in UNITS:    #(the tables are bound as locals for speed)
+        once = twice = 0
+        for c in unit:
+            m = cand[c]
+            twice |= once & m
+            once |= m
+        if once != ALL:
+            return False    #some digit has no place in the unit
+        unique = once & ~twice
+        if not unique:
+            continue
+        for c in unit:
+            m = cand[c]
+            if m & unique and POPCOUNT[m] > 1:
+                m &= unique
+                if POPCOUNT[m] > 1:
+                    return False    #two digits need this cell
+                if not _assign(cand, c, m):
+                    return False
+    return True
+
+def _initial(board):
+    '''candidate masks of a board (list of 9 lists, 0 for an empty
+       cell), None if the givens clash'''
+    rows = [0] * 9
+    cols = [0] * 9
+    boxes = [0] * 9
+    cand = [ALL] * 81
+    for i in range(9):
+        row = board[i]
+        for j in range(9):
+            d = row[j]
+            if d:
+                bit = 1 << (d - 1)
+                k = 3 * (i // 3) + j // 3
+                if (rows[i] | cols[j] | boxes[k]) & bit:
+                    return None
+                rows[i] |= bit
+                cols[j] |= bit
+                boxes[k] |= bit
+                cand[9 * i + j] = bit
+    #the other cells lose the digits used in their row, column and box
+    singles = []
+    for i in range(9):
+        for j in range(9):
+            c = 9 * i + j
+            if not board[i][j]:
+                m = ALL & ~(rows[i] | cols[j] | boxes[3 * (i // 3) + j // 3])
+                if not m:
+                    return None
+                cand[c] = m
+                if POPCOUNT[m] == 1:
+                    singles.append(c)
+    for c in singles:
+        if not _assign(cand, c, cand[c]):
+            return None
+    return cand
+
+def _search(cand, stats=None):
+    '''generate the solved candidate lists reachable from cand. If
+       given, the dictionary stats gets the number of 'nodes' searched
+       and of 'guesses' (nodes that branched) so far.'''
+    nodes = guesses = 0
+    stack = [cand]
+    while stack:
+        cand = stack.pop()
+        nodes += 1
+        if not _hiddenSingles(cand):
+            continue
+        best = None
+        fewest = 10
+        for c in range(81):
+            n = POPCOUNT[cand[c]]
+            if 1 < n < fewest:
+                best = c
+                fewest = n
+                if n == 2:
+                    break
+        if best is None:
+            if stats is not None:
+                stats['nodes'] = nodes
+                stats['guesses'] = guesses
+            yield cand
+            continue
+        guesses += 1
+        m = cand[best]
+        bits = []
+        while m:
+            b = m & -m
+            m ^= b
+            bits.append(b)
+        for b in reversed(bits):    #smallest digit on top
+            child = cand[:]
+            if _assign(child, best, b):
+                stack.append(child)
+    if stats is not None:
+        stats['nodes'] = nodes
+        stats['guesses'] = guesses
+
+def cellVariables():
+    '''the 81 cell variables, in row order, named as in sudokuCSP'''
+    return [Variable("V{},{}".format(i, j), range(1, 10))
+            for i in range(1, 10) for j in range(1, 10)]
+
+def bitSolutions(board, vars=None):
+    '''Generate the solutions of board (in the format of sudokuCSP),
+       each a list of (var, value) pairs as returned by bt_search.
+       vars is the list of the 81 cell variables in row order (see
+       cellVariables). Pass the same list for many boards to avoid
+       creating the variables every time.'''
+    if vars is None:
+        vars = cellVariables()
+    cand = _initial(board)
+    if cand is None:
+        return
+    for s in _search(cand):
+        yield [(vars[c], DIGIT[s[c]]) for c in range(81)]
+
+def bitSolve(board, vars=None):
+    '''Return the first solution of board (see bitSolutions) or None'''
+    for s in bitSolutions(board, vars):
+        return s
+    return None
+
+def bitCount(board, limit=None, stats=None):
+    '''Return the number of solutions of board (up to limit, e.g.,
+       limit=2 to check that the solution is unique). If given, the
+       dictionary stats gets the number of 'nodes' and 'guesses' of
+       the search.'''
+    if stats is not None:
+        stats['nodes'] = stats['guesses'] = 0
+    cand = _initial(board)
+    if cand is None:
+        return 0
+    found = 0
+    for s in _search(cand, stats):
+        found += 1
+        if limit is not None and found >= limit:
+            break
+    return found
+
+def randomGrid(rng=random):
+    '''Return a random solved board. The three boxes on the diagonal
+       don't constrain each other, so they are filled with random
+       permutations and the rest is solved.'''
+    board = [[0] * 9 for i in range(9)]
+    for b in range(3):
+        digits = range(1, 10)
+        rng.shuffle(digits)
+        for k in range(9):
+            board[3 * b + k // 3][3 * b + k % 3] = digits[k]
+    for s in _search(_initial(board)):
+        return [[DIGIT[s[9 * i + j]] for j in range(9)] for i in range(9)]
+
+def generatePuzzle(rng=random):
+    '''Return a random board with a unique solution, made by removing
+       the givens of a random grid in random order, putting back each
+       one whose removal leaves more than one solution (so no given
+       of the result can be removed)'''
+    board = randomGrid(rng)
+    cells = range(81)
+    rng.shuffle(cells)
+    for c in cells:
+        i, j = c // 9, c % 9
+        d = board[i][j]
+        board[i][j] = 0
+        if bitCount(board, 2) != 1:
+            board[i][j] = d
+    return board
+
+def puzzleMetrics(board):
+    '''Return a dictionary of difficulty measures of board: the
+       number of 'givens', 'solutions' (up to 2), and the 'nodes' and
+       'guesses' of the search proving it (0 guesses when naked and
+       hidden singles solve it)'''
+    stats = dict()
+    stats['solutions'] = bitCount(board, 2, stats)
+    stats['givens'] = sum([1 for row in board for d in row if d])
+    return stats
+
+def generatePuzzles(count, processes=1, seed=0):
+    '''Generate count (puzzle, metrics) pairs (see generatePuzzle and
+       puzzleMetrics). Puzzle i is generated from its own random
+       generator seeded with seed and i, so the puzzles don't depend
+       on processes. With processes > 1 the puzzles are generated by
+       that many worker processes (and still come out in order).'''
+    tasks = [(seed, i) for i in xrange(count)]
+    if processes > 1:
+        pool = multiprocessing.Pool(processes)
+        try:
+            for result in pool.imap(_generateTask, tasks, 4):
+                yield result
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for task in tasks:
+            yield _generateTask(task)
+
+def _generateTask(task):
+    seed, i = task
+    board = generatePuzzle(random.Random(1000003 * seed + i))
+    return board, puzzleMetrics(board)
@@ -0,0 +1,186 @@
+'''Solving a CSP by dynamic programming over a tree decomposition
+   (see TreeDecomposition), bt_search algorithm 'TD'.'''
+
+class TreeDecomposition:
+    '''Counts and enumerates the solutions of a CSP by dynamic
+       programming over a tree decomposition of its constraint graph
+       (the variables, linked if they are in the scope of a
+       constraint), in time and space exponential in the width of the
+       decomposition (the size of its largest bag) rather than in the
+       number of variables.
+
+       The decomposition comes from eliminating the variables in
+       min-fill order: the variable whose neighbours need the fewest
+       new links to become a clique goes next, and its bag is itself
+       plus its neighbours, which are then linked. The parent of a bag
+       is the bag of the first of its neighbours to be eliminated, so
+       a bag's variables other than its own (its separator) are all in
+       its parent. Each constraint is checked in the bag of the first
+       variable of its scope to be eliminated, which holds the whole
+       scope.
+
+       Bags are solved children first: every assignment of the bag's
+       variables (from their current domains) satisfying its
+       constraints gets the number of ways to extend it to the
+       variables eliminated below it, the product over its children of
+       their counts summed by separator. The count of the CSP is the
+       product over the roots of the sums of their counts, and the
+       solutions are enumerated top down, only visiting assignments
+       with a non zero count.'''
+
+    def __init__(self, csp):
+        self._csp = csp
+        self._vars = csp.variables()
+        self._eliminate()
+        self._tables = None
+        self.nodes = 0      #partial bag assignments tried
+
+    def _eliminate(self):
+        order = dict()
+        for i, v in enumerate(self._vars):
+            order[v] = i
+        adj = dict([(v, set()) for v in self._vars])
+        for c in self._csp.constraints():
+            for v in c.scope():
+                adj[v].update(c.scope())
+        for v in self._vars:
+            adj[v].discard(v)
+
+        def fill(v):
+            nbrs = list(adj[v])
+            missing = 0
+            for i in range(len(nbrs)):
+                for j in range(i + 1, len(nbrs)):
+                    if nbrs[j] not in adj[nbrs[i]]:
+                        missing += 1
+            return missing
+
+        self._order = []        #elimination order
+        self._bag = dict()      #var --> its bag (var first, then its separator)
+        remaining = set(self._vars)
+        while remaining:
+            v = min(remaining, key=lambda x: (fill(x), len(adj[x]), order[x]))
+            nbrs = sorted(adj[v], key=lambda x: order[x])
+            self._order.append(v)
+            self._bag[v] = [v] + nbrs
+            for x in nbrs:
+                adj[x].update(nbrs)
+                adj[x].discard(x)
+                adj[x].discard(v)
+            remaining.remove(v)
+            del adj[v]
+
+        position = dict([(v, i) for i, v in enumerate(self._order)])
+        self._parent = dict()
+        self._children = dict([(v, []) for v in self._vars])
+        self._roots = []
+        for v in self._order:
+            sep = self._bag[v][1:]
+            if sep:
+                p = min(sep, key=lambda x: position[x])
+                self._parent[v] = p
+                self._children[p].append(v)
+            else:
+                self._roots.append(v)
+        self._cnstrs = dict([(v, []) for v in self._vars])
+        for c in self._csp.constraints():
+            if c.scope():
+                first = min(c.scope(), key=lambda x: position[x])
+                self._cnstrs[first].append(c)
+
+    def width(self):
+        '''return the size of the largest bag less one (the treewidth of
+           the decomposition)'''
+        return max([len(b) for b in self._bag.values()] or [1]) - 1
+
+    def _solveBag(self, v, messages):
+        #return {assignment of the bag (tuple) : count} for the bag of v
+        bag = self._bag[v]
+        index = dict([(x, i) for i, x in enumerate(bag)])
+        #check each constraint and child when its last variable is assigned
+        checks = [[] for x in bag]
+        for c in self._cnstrs[v]:
+            checks[max([index[x] for x in c.scope()])].append(('c', c))
+        for child in self._children[v]:
+            sep = [index[x] for x in self._bag[child][1:]]
+            checks[max(sep) if sep else 0].append(('m', (sep, messages[child])))
+        domains = [x.curDomain() for x in bag]
+        table = dict()
+        values = [None] * len(bag)
+
+        def extend(i, weight):
+            if i == len(bag):
+                table[tuple(values)] = weight
+                return
+            for val in domains[i]:
+                self.nodes += 1
+                values[i] = val
+                bag[i].setValue(val)
+                w = weight
+                for kind, item in checks[i]:
+                    if kind == 'c':
+                        if not item.check():
+                            w = 0
+                    else:
+                        sep, message = item
+                        w *= message.get(tuple([values[k] for k in sep]), 0)
+                    if not w:
+                        break
+                if w:
+                    extend(i + 1, w)
+                bag[i].unAssign()
+
+        extend(0, 1)
+        return table
+
+    def _solve(self):
+        if self._tables is not None:
+            return
+        for v in self._vars:
+            v.unAssign()
+        self._tables = dict()
+        messages = dict()
+        for v in self._order:
+            table = self._solveBag(v, messages)
+            self._tables[v] = table
+            message = dict()
+            for asg, w in table.iteritems():
+                key = asg[1:]
+                message[key] = message.get(key, 0) + w
+            messages[v] = message
+
+    def count(self):
+        '''return the number of solutions'''
+        self._solve()
+        n = 1
+        for r in self._roots:
+            n *= sum(self._tables[r].values())
+        return n
+
+    def solutions(self):
+        '''Generate the solutions, each a list of (var, value) pairs in
+           the order of the CSP's variables'''
+        self._solve()
+        #assignments of each bag indexed by the values of its separator
+        bySep = dict()
+        for v in self._order:
+            idx = dict()
+            for asg in self._tables[v]:
+                idx.setdefault(asg[1:], []).append(asg)
+            bySep[v] = idx
+        vars = self._vars
+
+        def expand(pending, values):
+            #pending: bags still to assign (their separators are assigned)
+            if not pending:
+                yield [(x, values[x]) for x in vars]
+                return
+            v = pending[-1]
+            key = tuple([values[x] for x in self._bag[v][1:]])
+            for asg in bySep[v].get(key, []):
+                values[v] = asg[0]
+                for s in expand(pending[:-1] + self._children[v], values):
+                    yield s
+            values.pop(v, None)
+
+        return expand(list(reversed(self._roots)), dict())
@@ -29,6 +29,7 @@
 import sys
 import inspect
 import heapq, random
+import collections
 import cStringIO
 
 
@@ -151,11 +152,11 @@ class Stack:
 class Queue:
     "A container with a first-in-first-out (FIFO) queuing policy."
     def __init__(self):
-        self.list = []
+        self.list = collections.deque()
 
     def push(self,item):
         "Enqueue the 'item' into the queue"
-        self.list.insert(0,item)
+        self.list.appendleft(item)
 
     def pop(self):
         """